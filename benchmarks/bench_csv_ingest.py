@@ -0,0 +1,58 @@
+'''
+Benchmark for fusing many single-track takeout csvs.
+
+Generates FILE_COUNT csv files and compares the per-file DictReader loop
+fuse_main_csv used to run against ingest_csvs, inline and with workers.
+
+    poetry run python benchmarks/bench_csv_ingest.py [file_count]
+'''
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from play_takeout_to_plex.ingest import CSV_FIELDNAMES, ingest_csvs
+from play_takeout_to_plex.songs import SongRecord
+
+FILE_COUNT = 60_000
+HEADER_ROW = 'Title,Album,Artist,Duration (ms),Rating,Play Count,Removed\n'
+
+
+def make_csvs(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f'Track {i}.csv'
+        title = f'"Track {i}, Part 2"' if i % 10 == 0 else f'Track {i}'
+        path.write_text(f'{HEADER_ROW}{title},Album {i // 12},Artist&#39;s {i // 120},200000,0,{i % 7},\n')
+        paths.append(path)
+    return paths
+
+
+def dictreader_fuse(paths):
+    lines = []
+    for path in paths:
+        with open(path.absolute(), 'r') as csv_in:
+            reader = csv.DictReader(csv_in, fieldnames=CSV_FIELDNAMES)
+            next(reader)
+            lines.extend([SongRecord(original_csv_name=path.name, **line) for line in reader])
+    return lines
+
+
+def run(name, fuse, paths):
+    start = time.perf_counter()
+    records = fuse(paths)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<26} {elapsed:6.2f}s {len(paths) / elapsed:10.0f} files/s')
+    return records
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else FILE_COUNT
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_csvs(Path(directory), count)
+        expect = run('DictReader per file', dictreader_fuse, paths)
+        for workers in [1, None]:
+            label = f'ingest_csvs workers={workers or "cpus"}'
+            records, _ = run(label, lambda paths: ingest_csvs(paths, workers), paths)
+            assert records == expect
@@ -0,0 +1,58 @@
+'''
+Benchmark for exporting ratings and play counts to a plex library database.
+
+Builds a stand-in plex database with TRACK_COUNT tracks, a quarter of which
+already have settings rows, and times export_to_plex_db over all of them.
+
+    poetry run python benchmarks/bench_plex_export.py [track_count]
+'''
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from play_takeout_to_plex.plex_export import export_to_plex_db
+from play_takeout_to_plex.songs import SongRecord
+
+TRACK_COUNT = 100_000
+
+PLEX_SCHEMA = '''
+CREATE TABLE metadata_items (id INTEGER PRIMARY KEY, metadata_type INTEGER, guid VARCHAR(255));
+CREATE TABLE media_items (id INTEGER PRIMARY KEY, metadata_item_id INTEGER);
+CREATE TABLE media_parts (id INTEGER PRIMARY KEY, media_item_id INTEGER, file VARCHAR(255));
+CREATE TABLE metadata_item_settings (
+    id INTEGER PRIMARY KEY, account_id INTEGER, guid VARCHAR(255), rating FLOAT,
+    view_count INTEGER, created_at DATETIME, updated_at DATETIME
+);
+CREATE INDEX index_metadata_item_settings_on_guid ON metadata_item_settings (guid);
+'''
+
+
+def make_db(db_path, files):
+    with sqlite3.connect(str(db_path)) as connection:
+        connection.executescript(PLEX_SCHEMA)
+        connection.executemany('INSERT INTO metadata_items VALUES (?, 10, ?)',
+                               ((i, f'plex://track/{i}') for i in range(len(files))))
+        connection.executemany('INSERT INTO media_items VALUES (?, ?)', ((i, i) for i in range(len(files))))
+        connection.executemany('INSERT INTO media_parts (media_item_id, file) VALUES (?, ?)',
+                               ((i, str(file)) for i, file in enumerate(files)))
+        connection.executemany('INSERT INTO metadata_item_settings (account_id, guid, view_count) '
+                               'VALUES (1, ?, 3)', ((f'plex://track/{i}',) for i in range(0, len(files), 4)))
+    connection.close()
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else TRACK_COUNT
+    files = [Path(f'/music/Artist {i // 120}/Album {i // 12}/{i % 12:02d} - Track {i}.mp3')
+             for i in range(count)]
+    records = [SongRecord(title=f'Track {i}', album='', artist='', duration_ms=0, rating=i % 6,
+                          play_count=i % 40, removed=False, original_csv_name='') for i in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / 'com.plexapp.plugins.library.db'
+        make_db(db_path, files)
+        start = time.perf_counter()
+        result = export_to_plex_db(db_path, zip(files, records))
+        elapsed = time.perf_counter() - start
+    print(f'{count} tracks: inserted={result.inserted} updated={result.updated} '
+          f'missing={len(result.missing)} in {elapsed:.2f}s')
@@ -0,0 +1,73 @@
+'''
+Memory benchmark for the tag phase of merge_csv_with_filetags.
+
+Hard links one tagged mp3 (with cover art) FILE_COUNT times and parses every
+link with SongTags, holding on to the results the way matched_audiofiles does.
+Reports traced memory per file at checkpoints, next to a run holding the
+full eyed3 AudioFile objects, which is what SongTags used to keep. That run is
+capped at AUDIOFILE_COUNT files, as it needs over 100 KiB per file.
+
+    poetry run python benchmarks/bench_tag_memory.py [file_count]
+'''
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import eyed3
+
+from play_takeout_to_plex.songs import SongTags
+
+FILE_COUNT = 50_000
+AUDIOFILE_COUNT = 5_000
+COVER_ART_SIZE = 64 * 1024
+# MPEG-1 layer III, 128kbps, 44.1kHz frame header; 417 bytes per frame.
+MPEG_FRAME = b'\xff\xfb\x90\x64' + bytes(413)
+
+
+def make_template(directory):
+    template = directory / 'template.mp3'
+    template.write_bytes(MPEG_FRAME * 40)
+    audiofile = eyed3.load(template)
+    audiofile.initTag()
+    audiofile.tag.artist = 'Porcupine Tree'
+    audiofile.tag.album = 'Deadwing'
+    audiofile.tag.title = 'Open Car'
+    audiofile.tag.track_num = (7, 9)
+    audiofile.tag.images.set(3, os.urandom(COVER_ART_SIZE), 'image/jpeg')
+    audiofile.tag.save()
+    return template
+
+
+def make_links(directory, template, count):
+    links = []
+    for i in range(count):
+        link = directory / f'Porcupine Tree - Deadwing - Open Car({i}).mp3'
+        os.link(template, link)
+        links.append(link)
+    return links
+
+
+def measure(name, load, paths):
+    checkpoints = {len(paths) * step // 5 for step in range(1, 6)}
+    held = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i, path in enumerate(paths, 1):
+        held.append(load(path))
+        if i in checkpoints:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f'{name:<18} files={i:<7} per_file={(current - baseline) / i / 1024:8.2f} KiB '
+                  f'peak={(peak - baseline) / (1024 * 1024):8.1f} MiB')
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else FILE_COUNT
+    eyed3.log.setLevel('ERROR')
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        paths = make_links(directory, make_template(directory), count)
+        measure('SongTags', lambda path: SongTags(filepath=path), paths)
+        measure('eyed3.AudioFile', eyed3.load, paths[:AUDIOFILE_COUNT])
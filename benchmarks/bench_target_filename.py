@@ -0,0 +1,51 @@
+'''
+Micro-benchmark for RecordTagLink.target_filename.
+
+Builds 100k links without touching eyed3 and reads target_filename the
+way move_audio_files and its duplicate logging do (several times per link).
+
+    poetry run python benchmarks/bench_target_filename.py
+'''
+import timeit
+from pathlib import Path
+
+from play_takeout_to_plex.songs import SongRecord, SongTags, RecordTagLink
+
+LINK_COUNT = 100_000
+READS_PER_LINK = 3
+
+
+def build_links(count):
+    links = []
+    for i in range(count):
+        title = f'{i % 20:02d} - Track {i}' if i % 2 else f'Track {i}'
+        tags = SongTags(filepath=Path('Tracks') / f'Artist - Album - Track {i}.mp3', pull_tags=False)
+        tags.track = i % 20 + 1
+        tags.title = title
+        tags.album = f'Album {i // 12}'
+        tags.artist = f'Artist {i // 120}'
+        record = SongRecord(title=title, album=tags.album, artist=tags.artist, duration_ms=0,
+                            rating=0, play_count=0, removed=False, original_csv_name='')
+        links.append(RecordTagLink(songrecord=record, tags=tags))
+    return links
+
+
+def read_cached(links):
+    for link in links:
+        for _ in range(READS_PER_LINK):
+            link.target_filename
+
+
+def read_uncached(links):
+    for link in links:
+        for _ in range(READS_PER_LINK):
+            link._build_target_filename()
+
+
+if __name__ == '__main__':
+    links = build_links(LINK_COUNT)
+    uncached = min(timeit.repeat(lambda: read_uncached(links), number=1, repeat=3))
+    cached = min(timeit.repeat(lambda: read_cached(links), number=1, repeat=3))
+    print(f'{LINK_COUNT} links x {READS_PER_LINK} reads')
+    print(f'uncached: {uncached:.3f}s')
+    print(f'cached:   {cached:.3f}s ({uncached / cached:.1f}x)')
@@ -0,0 +1,64 @@
+'''
+Throughput benchmark for file transfers.
+
+Copies a batch of generated media-sized files with each strategy and
+reports MB/s. Pass a directory on the storage under test (defaults to a
+temporary directory).
+
+    poetry run python benchmarks/bench_transfer.py [directory]
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from play_takeout_to_plex.transfer import copy_and_hash, copy_file, verified_transfer
+
+FILE_COUNT = 40
+FILE_SIZE = 8 * 1024 * 1024
+
+STRATEGIES = {
+    'shutil.copyfile': shutil.copyfile,
+    'copy_file': copy_file,
+    'copy_file drop_cache': partial(copy_file, drop_cache=True),
+    'buffered 64KiB': partial(copy_file, buffer_size=64 * 1024, kernel_copy=False),
+    'buffered 1MiB': partial(copy_file, buffer_size=1024 * 1024, kernel_copy=False),
+    'buffered 8MiB': partial(copy_file, buffer_size=8 * 1024 * 1024, kernel_copy=False),
+    'copy_and_hash': copy_and_hash,
+    'verified_transfer': verified_transfer,
+}
+
+
+def make_sources(directory):
+    sources = []
+    for i in range(FILE_COUNT):
+        source = directory / f'source_{i}.mp3'
+        source.write_bytes(os.urandom(FILE_SIZE))
+        sources.append(source)
+    return sources
+
+
+def run(directory):
+    sources = make_sources(directory)
+    total_mb = FILE_COUNT * FILE_SIZE / (1024 * 1024)
+    for name, strategy in STRATEGIES.items():
+        out = directory / name
+        out.mkdir()
+        start = time.perf_counter()
+        for source in sources:
+            strategy(source, out / source.name)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24} {total_mb / elapsed:8.1f} MB/s')
+        shutil.rmtree(out)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with tempfile.TemporaryDirectory(dir=sys.argv[1]) as directory:
+            run(Path(directory))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            run(Path(directory))
@@ -0,0 +1,90 @@
+import csv
+import io
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .songs import SongRecord
+
+CSV_FIELDNAMES = ['title', 'album', 'artist', 'duration_ms', 'rating', 'play_count', 'removed']
+# Takeout csvs hold a single track each, so batches keep the per-task overhead of the pool low.
+CSV_BATCH_SIZE = 512
+
+
+@dataclass
+class RowError:
+    csv_name: str
+    line_num: int
+    reason: str
+
+
+def _split_rows(text: str):
+    if '"' not in text:
+        # Nothing is quoted, so a plain split is equivalent to the csv module and much cheaper.
+        # Split on newlines only: str.splitlines also breaks on characters such as \u2028 that csv keeps.
+        lines = (line[:-1] if line.endswith('\r') else line for line in text.split('\n'))
+        return [line.split(',') for line in lines if line]
+    return [row for row in csv.reader(io.StringIO(text, newline='')) if row]
+
+
+def parse_csv_text(text: str, csv_name: str) -> Tuple[List[SongRecord], List[RowError]]:
+    '''
+    Parse the contents of one takeout csv, skipping its header.
+    Rows that can't be turned in to a SongRecord are reported instead of failing the whole file.
+    '''
+    rows = _split_rows(text)
+    if not rows:
+        return [], [RowError(csv_name, 1, 'missing header')]
+
+    records = []
+    errors = []
+    for line_num, row in enumerate(rows[1:], 2):
+        if len(row) != len(CSV_FIELDNAMES):
+            reason = f'expected {len(CSV_FIELDNAMES)} columns, got {len(row)}'
+            errors.append(RowError(csv_name, line_num, reason))
+            continue
+        try:
+            records.append(SongRecord(*row, original_csv_name=csv_name))
+        except ValueError as err:
+            errors.append(RowError(csv_name, line_num, str(err)))
+    return records, errors
+
+
+def read_csv_batch(csv_filenames: List[Path]) -> Tuple[List[SongRecord], List[RowError]]:
+    records = []
+    errors = []
+    for csv_filename in csv_filenames:
+        with open(csv_filename.absolute(), 'r') as csv_in:
+            file_records, file_errors = parse_csv_text(csv_in.read(), csv_filename.name)
+        records.extend(file_records)
+        errors.extend(file_errors)
+    return records, errors
+
+
+def ingest_csvs(csv_filenames: Iterable[Path],
+                workers: int = None,
+                batch_size: int = CSV_BATCH_SIZE) -> Tuple[List[SongRecord], List[RowError]]:
+    '''
+    Read and parse many small takeout csvs in batches, spread over worker processes.
+    Records come back in the same order as csv_filenames.
+    '''
+    csv_filenames = list(csv_filenames)
+    batches = [csv_filenames[start:start + batch_size] for start in range(0, len(csv_filenames), batch_size)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if workers <= 1:
+        return _combine(map(read_csv_batch, batches))
+
+    # Imported here as multiprocessing is slow to import and unused for small takeouts.
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _combine(executor.map(read_csv_batch, batches))
+
+
+def _combine(results):
+    records = []
+    errors = []
+    for batch_records, batch_errors in results:
+        records.extend(batch_records)
+        errors.extend(batch_errors)
+    return records, errors
@@ -0,0 +1,107 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List
+
+from .sharding import Shard
+from .songs import SongRecord, SongTags
+
+MATCH_REPORT_FILENAME = 'match_report.db'
+
+# Why an item could not be matched, as stored in the reason column.
+CSV_MISSING_ARTIST_ALBUM = 'csv_missing_artist_album'
+TAG_MISSING_ARTIST_ALBUM = 'tag_missing_artist_album'
+NO_CSV_ARTIST = 'no_csv_artist'
+NO_CSV_ALBUM = 'no_csv_album'
+
+SCHEMA = '''
+    CREATE TABLE match_failures (
+        id INTEGER PRIMARY KEY,
+        reason TEXT NOT NULL,
+        source TEXT NOT NULL,
+        artist TEXT,
+        album TEXT,
+        title TEXT,
+        track INTEGER,
+        file TEXT,
+        csv_name TEXT
+    );
+    CREATE INDEX match_failures_artist_album_title ON match_failures (artist, album, title);
+    CREATE INDEX match_failures_album ON match_failures (album);
+    CREATE INDEX match_failures_title ON match_failures (title);
+    CREATE INDEX match_failures_reason ON match_failures (reason);
+    CREATE VIEW match_summary AS
+        SELECT reason, source, COUNT(*) AS failures FROM match_failures GROUP BY reason, source;
+'''
+INSERT_FAILURE = '''
+    INSERT INTO match_failures (reason, source, artist, album, title, track, file, csv_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+@dataclass
+class MatchFailure:
+    reason: str
+    source: str
+    artist: str = None
+    album: str = None
+    title: str = None
+    track: int = None
+    file: str = None
+    csv_name: str = None
+
+    def as_row(self):
+        return (self.reason, self.source, self.artist, self.album, self.title, self.track, self.file,
+                self.csv_name)
+
+
+def match_report_filename(shard: Shard = None) -> str:
+    # Shards share the takeout directory, so each writes its own report.
+    if shard:
+        return f'match_report_{shard.index}_of_{shard.count}.db'
+    return MATCH_REPORT_FILENAME
+
+
+def match_failures(lost_lines: List[SongRecord],
+                   lost_audiofiles: List[Path],
+                   unmatched_audiofiles: List[SongTags],
+                   main_csv: Iterable[SongRecord] = ()) -> List[MatchFailure]:
+    '''
+    Turn the failures returned by merge_csv_with_filetags in to report rows.
+    With the main csv, unmatched audio files are split by whether the csv knows their artist at all,
+    which separates missing takeout parts from albums that are named differently in the tags.
+    '''
+    csv_artists = {line.artist for line in main_csv}
+    failures = [
+        MatchFailure(CSV_MISSING_ARTIST_ALBUM, 'csv', line.artist, line.album, line.title,
+                     csv_name=line.original_csv_name)
+        for line in lost_lines
+    ]
+    failures.extend(
+        MatchFailure(TAG_MISSING_ARTIST_ALBUM, 'audiofile', file=str(audiofile))
+        for audiofile in lost_audiofiles
+    )
+    failures.extend(
+        MatchFailure(NO_CSV_ALBUM if tags.artist in csv_artists else NO_CSV_ARTIST, 'audiofile',
+                     tags.artist, tags.album, tags.title, tags.track, str(tags.filepath))
+        for tags in unmatched_audiofiles
+    )
+    return failures
+
+
+def write_match_report(db_path: Path, failures: List[MatchFailure]):
+    '''
+    Write match failures to an indexed sqlite database at db_path, replacing any earlier report,
+    so they can be triaged with queries instead of rescanning the library after every fix.
+    '''
+    # Only needed when matching fails, so kept out of cli startup.
+    import sqlite3
+    if os.path.exists(db_path):
+        os.unlink(db_path)
+    connection = sqlite3.connect(str(db_path))
+    try:
+        connection.executescript(SCHEMA)
+        with connection:
+            connection.executemany(INSERT_FAILURE, (failure.as_row() for failure in failures))
+    finally:
+        connection.close()
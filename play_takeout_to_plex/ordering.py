@@ -0,0 +1,78 @@
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Not available on windows
+    fcntl = None
+
+# glob:        takeout order, as returned by Path.glob.
+# inode:       reads and transfers sorted by source inode, which roughly follows allocation order.
+# physical:    reads and transfers sorted by the physical offset of the first extent, where available.
+# destination: reads sorted by inode, transfers grouped by destination album directory.
+IO_ORDERS = ('glob', 'inode', 'physical', 'destination')
+DEFAULT_IO_ORDER = 'glob'
+
+# linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+
+
+def physical_offset(path: Path):
+    '''
+    Physical offset of the first extent of path on its device, or None if the filesystem can't say.
+    '''
+    if fcntl is None:
+        return None
+    request = bytearray(FIEMAP_HEADER.pack(0, 2 ** 64 - 1, 0, 0, 1, 0) + bytes(FIEMAP_EXTENT.size))
+    try:
+        with open(path, 'rb') as infile:
+            fcntl.ioctl(infile.fileno(), FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    mapped_extents = FIEMAP_HEADER.unpack_from(request)[3]
+    if not mapped_extents:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+
+def _inode_key(path: Path):
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino)
+
+
+def _physical_key(path: Path):
+    # Files without a known offset (inline data, unsupported filesystem) go last, in inode order.
+    offset = physical_offset(path)
+    return (offset is None, offset or 0, _inode_key(path))
+
+
+def _read_key(io_order: str):
+    if io_order == 'physical':
+        return _physical_key
+    return _inode_key
+
+
+def order_reads(paths: Iterable[Path], io_order: str = DEFAULT_IO_ORDER) -> List[Path]:
+    '''Order source files for reading according to io_order.'''
+    if io_order == 'glob':
+        return list(paths)
+    key = _read_key(io_order)
+    return [path for _, path in sorted(((key(path), path) for path in paths), key=lambda pair: pair[0])]
+
+
+def order_transfers(transfers: Iterable[Tuple[Path, Path]],
+                    io_order: str = DEFAULT_IO_ORDER) -> List[Tuple[Path, Path]]:
+    '''Order (origin, target) pairs for transfer according to io_order.'''
+    if io_order == 'glob':
+        return list(transfers)
+    key = _read_key(io_order)
+    keyed = [(key(origin), origin, target) for origin, target in transfers]
+    if io_order == 'destination':
+        keyed.sort(key=lambda item: (str(item[2].parent), item[0]))
+    else:
+        keyed.sort(key=lambda item: item[0])
+    return [(origin, target) for _, origin, target in keyed]
@@ -0,0 +1,236 @@
+import argparse
+import csv
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .ingest import ingest_csvs
+from .songs import SongRecord
+from .transfer import TRANSFER_RECORD_FILENAME
+
+PLEX_TRACK_TYPE = 10
+PLEX_DEFAULT_ACCOUNT_ID = 1
+# Rows per transaction. Large enough that commits don't dominate, small enough to keep the write lock short.
+EXPORT_BATCH_SIZE = 5000
+
+TRACK_GUIDS_QUERY = '''
+    SELECT media_parts.file, metadata_items.guid
+    FROM media_parts
+    JOIN media_items ON media_parts.media_item_id = media_items.id
+    JOIN metadata_items ON media_items.metadata_item_id = metadata_items.id
+    WHERE metadata_items.metadata_type = ?
+'''
+INSERT_SETTINGS = '''
+    INSERT INTO metadata_item_settings (account_id, guid, rating, view_count, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+# Existing plex values win where the takeout has nothing to add: no rating, or fewer plays.
+UPDATE_SETTINGS = '''
+    UPDATE metadata_item_settings
+    SET rating = COALESCE(?, rating),
+        view_count = MAX(COALESCE(view_count, 0), ?),
+        updated_at = ?
+    WHERE account_id = ? AND guid = ?
+'''
+
+
+logging.basicConfig(format='%(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlexExportResult:
+    inserted: int = 0
+    updated: int = 0
+    missing: List[Path] = field(default_factory=list)
+
+
+def plex_rating(rating: int):
+    '''
+    Google Play stores thumbs down/up as 1/5 (or 1-5 stars), Plex stores 0-10.
+    Unrated tracks return None so they don't overwrite a rating made in plex.
+    '''
+    return rating * 2 if rating else None
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def export_to_plex_db(db_path: Path,
+                      tracks: Iterable[Tuple[Path, SongRecord]],
+                      account_id: int = PLEX_DEFAULT_ACCOUNT_ID,
+                      batch_size: int = EXPORT_BATCH_SIZE) -> PlexExportResult:
+    '''
+    Write takeout ratings and play counts to a plex library database for (plex file path, record) pairs.
+    Tracks are looked up with a single query and written with batched executemany transactions over one
+    connection. Plex should not be running while its database is written to.
+    '''
+    # Only needed for this optional stage, so kept out of cli startup.
+    import sqlite3
+    result = PlexExportResult()
+    now = int(time.time())
+    connection = sqlite3.connect(str(db_path))
+    try:
+        guids_by_file = dict(connection.execute(TRACK_GUIDS_QUERY, (PLEX_TRACK_TYPE,)))
+        existing_guids = {
+            guid for (guid,) in
+            connection.execute('SELECT guid FROM metadata_item_settings WHERE account_id = ?', (account_id,))
+        }
+
+        inserts = []
+        updates = []
+        for plex_file, record in tracks:
+            guid = guids_by_file.get(str(plex_file))
+            if guid is None:
+                result.missing.append(plex_file)
+            elif guid in existing_guids:
+                updates.append((plex_rating(record.rating), record.play_count, now, account_id, guid))
+            else:
+                existing_guids.add(guid)
+                inserts.append((account_id, guid, plex_rating(record.rating), record.play_count, now, now))
+
+        for batch in _batches(inserts, batch_size):
+            with connection:
+                connection.executemany(INSERT_SETTINGS, batch)
+            result.inserted += len(batch)
+        for batch in _batches(updates, batch_size):
+            with connection:
+                connection.executemany(UPDATE_SETTINGS, batch)
+            result.updated += len(batch)
+    finally:
+        connection.close()
+
+    return result
+
+
+def read_transfer_record(record_path: Path) -> List[Tuple[Path, str]]:
+    '''
+    (target, csv name) of every transfer in a transfer record or shard report.
+    Raises ValueError for files without Target and Csv columns.
+    '''
+    with open(record_path, 'r', newline='') as infile:
+        reader = csv.DictReader(infile)
+        if not {'Target', 'Csv'}.issubset(reader.fieldnames or []):
+            raise ValueError(f'{record_path} has no Target and Csv columns')
+        return [(Path(row['Target']), row['Csv']) for row in reader]
+
+
+def match_transferred_files(takeout_directory: Path,
+                            transfers: Iterable[Tuple[Path, str]],
+                            workers: int = None) -> Tuple[List[Tuple[Path, SongRecord]], List[Path]]:
+    '''
+    Pair transferred files with the takeout csv line they were matched with when transferred.
+    Only the recorded csvs are read, the audio files are not.
+    Targets are taken as ArtistName/AlbumName/file, so records made from another working directory still
+    resolve. Returns ((target relative to the output directory, record) pairs, unmatched targets).
+    '''
+    transfers = list(transfers)
+    csv_names = {csv_name for _, csv_name in transfers if csv_name}
+    records, errors = ingest_csvs(
+        (takeout_directory / csv_name for csv_name in sorted(csv_names)
+         if (takeout_directory / csv_name).is_file()),
+        workers,
+    )
+    for error in errors:
+        logger.error('csv_row_error file=%s line=%d reason=%s', error.csv_name, error.line_num, error.reason)
+    records_by_csv = {record.original_csv_name: record for record in records}
+
+    matched = []
+    unmatched = []
+    for target, csv_name in transfers:
+        record = records_by_csv.get(csv_name)
+        if record:
+            matched.append((Path(*target.parts[-3:]), record))
+        else:
+            unmatched.append(target)
+    return matched, unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Write takeout ratings and play counts to a plex library database, '
+                     'for the files a play2plex run transferred'))
+    parser.add_argument(
+        'output_directory',
+        type=str,
+        help='The output directory of the play2plex run, once plex has scanned it.',
+    )
+    parser.add_argument(
+        'takeout_tracks_directory',
+        type=str,
+        help='The takeout tracks directory of the play2plex run, still holding the takeout csvs.',
+    )
+    parser.add_argument(
+        'plex_db',
+        type=str,
+        help=('Path to the plex library database (com.plexapp.plugins.library.db). '
+              'Stop plex and back up the database first.'),
+    )
+    parser.add_argument(
+        '--transfer-record',
+        type=str,
+        default=None,
+        nargs='?',
+        help=(f'The record of transferred files: {TRANSFER_RECORD_FILENAME} or a shard report. '
+              f'Defaults to {TRANSFER_RECORD_FILENAME} in the output directory.'),
+    )
+    parser.add_argument(
+        '--plex-music-directory',
+        type=str,
+        default=None,
+        nargs='?',
+        help=('The output directory as plex sees it, if plex runs with a different mount. '
+              'Defaults to the absolute output directory.'),
+    )
+    parser.add_argument(
+        '--plex-account-id',
+        type=int,
+        default=PLEX_DEFAULT_ACCOUNT_ID,
+        nargs='?',
+        help='The plex account to write ratings and play counts for. Defaults to the server owner.',
+    )
+    cmd_args = vars(parser.parse_args())
+    # The export summary is logged at info level.
+    logging.getLogger(__package__).setLevel(logging.INFO)
+
+    output_directory = Path(cmd_args['output_directory'])
+    takeout_directory = Path(cmd_args['takeout_tracks_directory'])
+    for path in [output_directory, takeout_directory]:
+        if not path.is_dir():
+            logger.error('%s is not a directory.', str(path.absolute()))
+            sys.exit(1)
+    record_path = Path(cmd_args.get('transfer_record') or output_directory / TRANSFER_RECORD_FILENAME)
+    for path in [Path(cmd_args['plex_db']), record_path]:
+        if not path.is_file():
+            logger.error('%s is not a file.', str(path.absolute()))
+            sys.exit(1)
+
+    try:
+        transfers = read_transfer_record(record_path)
+    except ValueError as err:
+        logger.error('%s', err)
+        sys.exit(1)
+
+    matched, unmatched = match_transferred_files(takeout_directory, transfers)
+    if unmatched:
+        logger.error('%d transferred files have no readable takeout csv: %s', len(unmatched), str(unmatched))
+
+    plex_directory = Path(cmd_args.get('plex_music_directory') or output_directory.absolute())
+    result = export_to_plex_db(
+        Path(cmd_args['plex_db']),
+        [(plex_directory / relative, line) for relative, line in matched],
+        cmd_args.get('plex_account_id') or PLEX_DEFAULT_ACCOUNT_ID,
+    )
+    logger.info('plex_export inserted=%d updated=%d missing=%d',
+                result.inserted, result.updated, len(result.missing))
+    if result.missing:
+        logger.error(
+            '%d tracks were not found in the plex database. Has plex scanned %s yet? Missing: %s',
+            len(result.missing), str(plex_directory), str(result.missing))
+    if unmatched or result.missing:
+        sys.exit(1)
@@ -0,0 +1,121 @@
+import io
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+# cprofile: deterministic, every call is traced. Exact, but slows call-heavy stages down noticeably.
+# sample:   a background thread records the main thread's stack every interval. Overhead stays low
+#           and constant regardless of library size, so it is the safer choice for full runs.
+PROFILE_MODES = ('cprofile', 'sample')
+DEFAULT_TOP = 20
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    '''Periodically records the stack of one thread, as a count per unique stack.'''
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        super().__init__(name='play2plex-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write_folded(self, path: Path):
+        '''Collapsed stack format, as read by flamegraph.pl and speedscope.'''
+        with open(path, 'w') as outfile:
+            outfile.writelines(f'{";".join(stack)} {count}\n' for stack, count in self.stacks.items())
+
+    def hotspots(self, top: int = DEFAULT_TOP) -> str:
+        total = sum(self.stacks.values())
+        own = Counter()
+        cumulative = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                cumulative[label] += count
+
+        lines = [f'{total} samples', f'{"own":>8} {"own%":>6} {"cum%":>6}  function']
+        for label, count in own.most_common(top):
+            own_percent = 100 * count / total
+            cumulative_percent = 100 * cumulative[label] / total
+            lines.append(f'{count:>8} {own_percent:>6.1f} {cumulative_percent:>6.1f}  {label}')
+        return '\n'.join(lines)
+
+
+class StageProfiler:
+    '''
+    Profiles each stage of a run separately, writing a dump and a top-N hotspot summary per stage
+    in to directory. With no mode, stages run unprofiled.
+    '''
+
+    def __init__(self, mode: str = None, directory: Path = Path('profile'), top: int = DEFAULT_TOP):
+        self.mode = mode
+        self.directory = directory
+        self.top = top
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.mode:
+            yield
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        if self.mode == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(str(self.directory / f'{name}.prof'))
+                self._write_summary(name, time.perf_counter() - start, self._cprofile_hotspots(profiler))
+        else:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                sampler.write_folded(self.directory / f'{name}.folded')
+                self._write_summary(name, time.perf_counter() - start, sampler.hotspots(self.top))
+
+    def _cprofile_hotspots(self, profiler) -> str:
+        import pstats
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(self.top)
+        return stream.getvalue().strip()
+
+    def _write_summary(self, name: str, elapsed: float, hotspots: str):
+        summary_path = self.directory / f'{name}.txt'
+        with open(summary_path, 'w') as outfile:
+            outfile.write(f'stage={name} mode={self.mode} elapsed={elapsed:.3f}s\n\n{hotspots}\n')
+        logger.info('profile stage=%s elapsed=%.3fs summary=%s', name, elapsed, str(summary_path))
@@ -0,0 +1,136 @@
+import argparse
+import csv
+import logging
+import re
+import sys
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SHARD_REPORT_GLOB = 'shard_*_of_*.csv'
+SHARD_REPORT_PATTERN = re.compile(r'shard_(\d+)_of_(\d+)\.csv')
+MERGED_REPORT_FILENAME = 'shard_report.csv'
+REPORT_HEADER = ['Shard', 'Origin', 'Target', 'Csv']
+
+
+logging.basicConfig(format='%(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def shard_key(audiofile: Path) -> str:
+    '''
+    Takeout names audio files "Artist - Album - Title.ext", so the leading part identifies the artist
+    without having to read any tags.
+    '''
+    return audiofile.name.split(' - ', 1)[0].strip().casefold()
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f'Shard index must be between 0 and {self.count - 1}.')
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+    @property
+    def report_filename(self):
+        return f'shard_{self.index}_of_{self.count}.csv'
+
+    def includes(self, audiofile: Path) -> bool:
+        # crc32 rather than hash() so every worker agrees regardless of PYTHONHASHSEED.
+        return zlib.crc32(shard_key(audiofile).encode('utf-8')) % self.count == self.index
+
+
+def parse_shard(value: str) -> Shard:
+    try:
+        index, count = (int(part) for part in value.split('/'))
+        return Shard(index, count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'{value} is not a valid shard. Use i/N, where i is between 0 and N-1.')
+
+
+def write_shard_report(shard: Shard,
+                       transfers: List[Tuple[Path, Path]],
+                       full_path: Path,
+                       csv_names: Dict[Path, str] = None):
+    '''Like transfer.write_transfer_record, for one shard of a run.'''
+    csv_names = csv_names or {}
+    with open(full_path / shard.report_filename, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(REPORT_HEADER)
+        writer.writerows([str(shard), str(origin), str(target), csv_names.get(origin, '')]
+                         for origin, target in transfers)
+
+
+def merge_shard_reports(full_path: Path, count: int):
+    '''
+    Combine per-shard reports from full_path in to one report.
+    Returns (missing_shards, collisions), where collisions maps a target to the shards that all write it.
+    Targets are compared case-insensitively, as they would be on most network shares.
+    '''
+    reports = {}
+    for report in full_path.glob(SHARD_REPORT_GLOB):
+        match = SHARD_REPORT_PATTERN.fullmatch(report.name)
+        if match and int(match.group(2)) == count:
+            reports[int(match.group(1))] = report
+    missing_shards = [index for index in range(count) if index not in reports]
+
+    rows = []
+    targets = {}
+    shards_by_target = defaultdict(set)
+    for index in sorted(reports):
+        with open(reports[index], 'r', newline='') as infile:
+            reader = csv.reader(infile)
+            next(reader, None)
+            for row in reader:
+                rows.append(row)
+                targets.setdefault(row[2].casefold(), row[2])
+                shards_by_target[row[2].casefold()].add(row[0])
+
+    with open(full_path / MERGED_REPORT_FILENAME, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(REPORT_HEADER)
+        writer.writerows(rows)
+
+    collisions = {targets[key]: sorted(shards) for key, shards in shards_by_target.items() if len(shards) > 1}
+    return missing_shards, collisions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Combine the reports of a sharded play2plex run and check for cross-shard collisions')
+    parser.add_argument(
+        'output_directory',
+        type=str,
+        help='The output directory shared by all shards, containing their shard reports.',
+    )
+    parser.add_argument(
+        'shard_count',
+        type=int,
+        help='The total number of shards (N in --shard i/N).',
+    )
+    cmd_args = vars(parser.parse_args())
+
+    full_path = Path(cmd_args['output_directory'])
+    if not full_path.is_dir():
+        logger.error(
+            'Output directory must be a directory. %s is not a directory.',
+            str(full_path.absolute()),
+        )
+        sys.exit(1)
+
+    missing_shards, collisions = merge_shard_reports(full_path, cmd_args['shard_count'])
+    if missing_shards:
+        logger.error('Missing reports for shards: %s', str(missing_shards))
+    for target, shards in collisions.items():
+        logger.error('shard_collision target=%s shards=%s', target, ','.join(shards))
+    if missing_shards or collisions:
+        sys.exit(1)
@@ -1,18 +1,34 @@
 import html
 import logging
+from functools import cached_property
 from pathlib import Path
 from dataclasses import dataclass, field
 
-import eyed3
-
 # Arbitrary length at which google takeout cuts off song titles etc.
 MAX_FILENAME_LEN = 47
 SHORTENED_FILENAME_LEN = MAX_FILENAME_LEN - 5
 
+# SongTags fields that the cached derived properties are computed from.
+DERIVED_TAG_FIELDS = frozenset({'filepath', 'track', 'title'})
+
 
 logger = logging.getLogger(__name__)
 
 
+def __getattr__(name):
+    # eyed3 is slow to import and only needed once tags are read, so it is loaded on first use.
+    # Going through the module attribute keeps songs.eyed3 patchable.
+    if name == 'eyed3':
+        import eyed3
+        globals()['eyed3'] = eyed3
+        return eyed3
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _eyed3():
+    return globals().get('eyed3') or __getattr__('eyed3')
+
+
 @dataclass
 class SongRecord:
     title: str
@@ -51,22 +67,37 @@ class SongTags:
     title: str = field(init=False)
     album: str = field(init=False)
     artist: str = field(init=False)
-    audiofile: eyed3.core.AudioFile = field(init=False)
     pull_tags: bool = True
 
     def __post_init__(self):
         if self.pull_tags:
-            self.audiofile = eyed3.load(self.filepath)
+            # Only the values are kept. The AudioFile (every frame, cover art, mpeg info) is released here
+            # and the file is reopened in save_tags for the few files that need writing.
+            tag = _eyed3().load(self.filepath).tag
             try:
                 # 2-tuple (track_num, total_tracks)
-                self.track = self.audiofile.tag.track_num[0]
+                self.track = tag.track_num[0]
             except (IndexError, TypeError):
-                self.track = self.audiofile.tag.track_num
-            self.title = self.audiofile.tag.title
-            self.album = self.audiofile.tag.album
-            self.artist = self.audiofile.tag.artist
-
-    @property
+                self.track = tag.track_num
+            self.title = tag.title
+            self.album = tag.album
+            self.artist = tag.artist
+
+    def save_tags(self):
+        '''Reopen the audio file and write the track number back to its tags.'''
+        audiofile = _eyed3().load(self.filepath)
+        audiofile.tag.track_num = self.track
+        audiofile.tag.save()
+
+    def __setattr__(self, name, value):
+        if name in DERIVED_TAG_FIELDS:
+            # Drop cached derived values and bump the revision so links re-derive their filename.
+            self.__dict__.pop('title_track_num', None)
+            self.__dict__.pop('has_title_extension', None)
+            self.__dict__['_revision'] = self.__dict__.get('_revision', 0) + 1
+        super().__setattr__(name, value)
+
+    @cached_property
     def title_track_num(self):
         try:
             # Will catch '01', '11', '1 ', etc.
@@ -77,7 +108,7 @@ class SongTags:
 
         return track_num
 
-    @property
+    @cached_property
     def has_title_extension(self):
         return bool(Path(self.title).suffixes)
 
@@ -90,6 +121,16 @@ class RecordTagLink:
 
     @property
     def target_filename(self):
+        cached = self.__dict__.get('_target_filename')
+        revision = self.tags.__dict__.get('_revision', 0)
+        if cached and cached[0] is self.tags and cached[1] == revision:
+            return cached[2]
+
+        target_filename = self._build_target_filename()
+        self.__dict__['_target_filename'] = (self.tags, revision, target_filename)
+        return target_filename
+
+    def _build_target_filename(self):
         try:
             if not self.tags.title_track_num:
                 # Prepend the track number to the track only if it isn't already there.
@@ -118,7 +159,6 @@ class RecordTagLink:
         tags_updated = []
         if not self.tags.track and self.tags.title_track_num:
             self.tags.track = self.tags.title_track_num
-            self.tags.audiofile.tag.track_num = self.tags.title_track_num
             tags_updated.append(self.tags.title_track_num)
 
         if tags_updated:
@@ -130,4 +170,4 @@ class RecordTagLink:
             )
 
             if not self.dry_run:
-                self.tags.audiofile.tag.save()
+                self.tags.save_tags()
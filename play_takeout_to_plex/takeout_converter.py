@@ -1,38 +1,42 @@
 import argparse
-import csv
 import logging
 import os
-import shutil
 import sys
 from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
 from typing import List, Dict
 from pathlib import Path
 
+from .ingest import ingest_csvs
+from .match_report import match_failures, match_report_filename, write_match_report
+from .profiling import DEFAULT_TOP, PROFILE_MODES, StageProfiler
+from .sharding import Shard, parse_shard, write_shard_report
+from .ordering import DEFAULT_IO_ORDER, IO_ORDERS, order_reads, order_transfers
 from .songs import SongRecord, SongTags, RecordTagLink
+from .throttle import IOThrottle
+from .transfer import (
+    COPY_BUFFER_SIZE,
+    copy_file,
+    move_file,
+    verified_transfer,
+    write_manifest,
+    write_transfer_record,
+)
 
 
 logging.basicConfig(format='%(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def fuse_main_csv(full_path: Path) -> List[Dict[str, str]]:
-    csv_filenames = full_path.glob('*.csv')
-    lines = []
-    for csv_filename in csv_filenames:
-        with open(csv_filename.absolute(), 'r') as csv_in:
-            reader = csv.DictReader(
-                csv_in,
-                fieldnames=['title', 'album', 'artist', 'duration_ms', 'rating', 'play_count', 'removed'],
-            )
-            try:
-                next(reader)
-                lines.extend([SongRecord(original_csv_name=csv_filename.name, **line) for line in reader])
-            except StopIteration:
-                logger.error('All csv files must begin with header')
-                return None
-            except TypeError:
-                logger.error('CSV files are not in expected format.')
-                return None
+def fuse_main_csv(full_path: Path, workers: int = None) -> List[SongRecord]:
+    '''
+    Parse every takeout csv in full_path.
+    Rows that can't be parsed are logged and left out rather than failing the whole fusion.
+    '''
+    lines, errors = ingest_csvs(full_path.glob('*.csv'), workers)
+    for error in errors:
+        logger.error('csv_row_error file=%s line=%d reason=%s', error.csv_name, error.line_num, error.reason)
     return lines
 
 
@@ -53,17 +57,44 @@ def output_main_csv(main_csv: List[SongRecord], full_path: Path):
 def move_audio_files(target_path: Path,
                      tagged_data: List[RecordTagLink],
                      copy: bool = True,
-                     dry_run: bool = False):
+                     dry_run: bool = False,
+                     verify: bool = False,
+                     buffer_size: int = COPY_BUFFER_SIZE,
+                     drop_cache: bool = False,
+                     io_order: str = DEFAULT_IO_ORDER,
+                     throttle: IOThrottle = None):
     '''
     Actually move or copy files.
     Loops twice despite being possible to do in one loop to prevent data loss
+    With verify, every transfer is checksummed and recorded in a manifest under target_path.
+    buffer_size and drop_cache tune copies, see transfer.copy_file.
+    io_order selects the order in which transfers are made, see ordering.IO_ORDERS.
+    throttle paces transfers, counting one operation per file plus the bytes copied.
+    Returns the (origin, target) pairs in transfer order, or None if transfers could not be made.
+    Transfers that failed verification are left out.
     '''
     existing_directories = set()
+    transfer_results = []
     if dry_run:
         def shutil_command(*args, **kwargs):
             pass
+    elif verify:
+        def shutil_command(origin, target):
+            transfer_results.append(verified_transfer(
+                origin, target, move=not copy, buffer_size=buffer_size, drop_cache=drop_cache,
+                throttle=throttle))
+    elif copy:
+        shutil_command = partial(copy_file, buffer_size=buffer_size, drop_cache=drop_cache, throttle=throttle)
     else:
-        shutil_command = shutil.copyfile if copy else shutil.move
+        # Moves across filesystems copy the data, which goes through the same tuned copy.
+        shutil_command = partial(move_file, buffer_size=buffer_size, drop_cache=drop_cache, throttle=throttle)
+
+    if throttle and not dry_run:
+        unthrottled_command = shutil_command
+
+        def shutil_command(origin, target):
+            throttle.operation()
+            unthrottled_command(origin, target)
 
     origins = []
     targets = []
@@ -99,23 +130,55 @@ def move_audio_files(target_path: Path,
             'Duplicate origins found. This is a programming error, '
             'as each file should only be processed once.')
 
-    for origin, target in zip(origins, targets):
+    transfers = order_transfers(zip(origins, targets), io_order)
+    for origin, target in transfers:
         shutil_command(origin, target)
 
+    if transfer_results:
+        write_manifest(transfer_results, target_path)
+        failed = [result for result in transfer_results if not result.verified]
+        if failed:
+            logger.error('%d of %d transfers failed verification. See the transfer manifest for details.',
+                         len(failed), len(transfer_results))
+            failed_origins = {result.origin for result in failed}
+            transfers = [(origin, target) for origin, target in transfers if origin not in failed_origins]
 
-def merge_csv_with_filetags(full_path: Path, main_csv: List[SongRecord], dry_run: bool):
-    lines_by_artist_album = defaultdict(dict)
+    return transfers
+
+
+def index_main_csv(main_csv: List[SongRecord], lines_by_artist_album: Dict[str, Dict[str, SongRecord]]):
+    '''
+    Add csv lines to an artist -> album -> line index.
+    Returns the lines that have no artist or album to be indexed by.
+    '''
     lost_lines = []
     for line in main_csv:
         if not line.artist or not line.album:
             lost_lines.append(line)
         else:
             lines_by_artist_album[line.artist][line.album] = line
+    return lost_lines
+
+
+def merge_csv_with_filetags(full_path: Path,
+                            main_csv: List[SongRecord],
+                            dry_run: bool,
+                            io_order: str = DEFAULT_IO_ORDER,
+                            shard: Shard = None,
+                            throttle: IOThrottle = None):
+    lines_by_artist_album = defaultdict(dict)
+    lost_lines = index_main_csv(main_csv, lines_by_artist_album)
 
     lost_audiofiles = []
     unmatched_audiofiles = []
     matched_audiofiles = []
-    for audiofile in full_path.glob('*.mp3'):
+    audiofiles = full_path.glob('*.mp3')
+    if shard:
+        audiofiles = filter(shard.includes, audiofiles)
+    for audiofile in order_reads(audiofiles, io_order):
+        if throttle:
+            # eyed3 only reads the tag and the first frames, so a tag read is paced as an operation.
+            throttle.operation()
         tags = SongTags(filepath=audiofile)
         if not tags.artist or not tags.album:
             lost_audiofiles.append(audiofile)
@@ -132,6 +195,10 @@ def merge_csv_with_filetags(full_path: Path, main_csv: List[SongRecord], dry_run
         return matched_audiofiles
 
 
+def throttled_stage(throttle: IOThrottle, name: str):
+    return throttle.stage(name) if throttle else nullcontext()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Convert google music takeout results to plex-friendly structure')
@@ -176,6 +243,127 @@ def main():
         help=('Specify the parent directory under which to create the '
               'new artist/album directories in to which to move the audio files.'),
     )
+    parser.add_argument(
+        '--verify-transfers',
+        type=bool,
+        default=False,
+        nargs='?',
+        help=('Checksum every file while it is copied and compare it against the written file. '
+              'When moving, originals are only removed after verification succeeds. '
+              'Results are written to transfer_manifest.csv in the output directory.'),
+    )
+    parser.add_argument(
+        '--copy-buffer-size',
+        type=int,
+        default=COPY_BUFFER_SIZE // 1024,
+        nargs='?',
+        help=('Buffer size in KiB used when a copy cannot be done in-kernel (sendfile/copy_file_range), '
+              'and when verifying transfers. Larger buffers help on spinning disks and network shares.'),
+    )
+    parser.add_argument(
+        '--drop-cache',
+        type=bool,
+        default=False,
+        nargs='?',
+        help=('Hint the OS to read sequentially and evict copied files from the page cache, '
+              'so copying a full library does not push everything else out of memory.'),
+    )
+    parser.add_argument(
+        '--io-order',
+        type=str,
+        default=DEFAULT_IO_ORDER,
+        choices=IO_ORDERS,
+        help=('Order in which audio files are read and transferred. '
+              'glob keeps takeout order. inode and physical follow the on-disk layout of the takeout, '
+              'which cuts seeks on spinning disks. destination additionally groups transfers by '
+              'album directory, which reduces metadata churn on network targets.'),
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        default=None,
+        help=('Only process shard i of N (0-based, e.g. 0/4), split deterministically by artist. '
+              'Each shard writes shard_i_of_N.csv to the output directory; '
+              'combine them with play2plex-merge-shards to check for collisions between shards.'),
+    )
+    parser.add_argument(
+        '--csv-workers',
+        type=int,
+        default=None,
+        nargs='?',
+        help='Number of processes used to parse the takeout csv files. Defaults to the number of CPUs.',
+    )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        default=None,
+        choices=PROFILE_MODES,
+        help=('Profile each stage and write a dump plus a top hotspot summary per stage. '
+              'cprofile traces every call; sample records stacks periodically with low overhead, '
+              'and is the safer choice on full-size libraries.'),
+    )
+    parser.add_argument(
+        '--profile-directory',
+        type=str,
+        default='profile',
+        nargs='?',
+        help='Directory to write profile dumps and summaries to. Defaults to \'profile\'.',
+    )
+    parser.add_argument(
+        '--profile-top',
+        type=int,
+        default=DEFAULT_TOP,
+        nargs='?',
+        help='Number of hotspots to include in each stage summary.',
+    )
+    parser.add_argument(
+        '--watch',
+        type=bool,
+        default=False,
+        nargs='?',
+        help=('Keep running and process csv and audio files as they land in the takeout tracks directory, '
+              'e.g. while takeout parts are still downloading. '
+              'Stops on ctrl-c or after --watch-idle-timeout.'),
+    )
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=2.0,
+        nargs='?',
+        help='Seconds between checks for new files in watch mode.',
+    )
+    parser.add_argument(
+        '--watch-idle-timeout',
+        type=float,
+        default=None,
+        nargs='?',
+        help='Stop watching once no new files have arrived for this many seconds.',
+    )
+    parser.add_argument(
+        '--max-mb-per-second',
+        type=float,
+        default=None,
+        nargs='?',
+        help=('Limit file transfers to this many MB/s, to leave bandwidth for plex clients on shared '
+              'storage. Tag reads only touch the start of each file and are limited by --max-ops-per-second '
+              'instead.'),
+    )
+    parser.add_argument(
+        '--max-ops-per-second',
+        type=float,
+        default=None,
+        nargs='?',
+        help='Limit tag reads and file transfers to this many files per second.',
+    )
+    parser.add_argument(
+        '--throttle-control',
+        type=str,
+        default=None,
+        nargs='?',
+        help=('File with "mb_per_second = N" and "ops_per_second = N" lines, overriding the limits above. '
+              'Limits left out of the file are kept, and 0 removes a limit. '
+              'It is re-read when it changes or on SIGHUP, so limits can be adjusted during a run.'),
+    )
     cmd_args = vars(parser.parse_args())
 
     # Validate tracks directory is actually a directory.
@@ -187,6 +375,9 @@ def main():
         )
         sys.exit(1)
 
+    if cmd_args.get('watch') and cmd_args.get('main_csv'):
+        parser.error('--main-csv cannot be used with --watch, which builds the main csv as csvs arrive.')
+
     # Validate the main csv is actually a file if it was specified
     main_csv = Path(cmd_args['main_csv']) if cmd_args.get('main_csv') else None
     if main_csv:
@@ -194,20 +385,96 @@ def main():
             logger.error('Main CSV file must be a csv file. %s is not a csv file.', str(main_csv.absolute()))
             sys.exit(1)
 
+    throttle = IOThrottle(
+        cmd_args.get('max_mb_per_second'),
+        cmd_args.get('max_ops_per_second'),
+        Path(cmd_args['throttle_control']) if cmd_args.get('throttle_control') else None,
+    )
+    if throttle.enabled:
+        throttle.install_signal_handler()
+    else:
+        throttle = None
+
+    # Profile summaries, watch progress and throttle statistics are logged at info level.
+    if cmd_args.get('profile') or cmd_args.get('watch') or throttle:
+        logging.getLogger(__package__).setLevel(logging.INFO)
+
+    profiler = StageProfiler(
+        cmd_args.get('profile'),
+        Path(cmd_args.get('profile_directory') or 'profile'),
+        cmd_args.get('profile_top') or DEFAULT_TOP,
+    )
+    io_order = cmd_args.get('io_order') or DEFAULT_IO_ORDER
+
+    if cmd_args.get('watch'):
+        # Imported here as watch mode builds on this module.
+        from .watch import IncrementalConverter, watch_takeout
+        converter = IncrementalConverter(
+            Path(cmd_args['output_directory']),
+            shard=cmd_args.get('shard'),
+            dry_run=cmd_args.get('dry_run'),
+            throttle=throttle,
+            csv_workers=cmd_args.get('csv_workers'),
+            copy=not cmd_args.get('move_files'),
+            verify=cmd_args.get('verify_transfers'),
+            buffer_size=(cmd_args.get('copy_buffer_size') or COPY_BUFFER_SIZE // 1024) * 1024,
+            drop_cache=cmd_args.get('drop_cache'),
+            io_order=io_order,
+        )
+        # One stage for the whole watch, as batches are too small to profile on their own.
+        with profiler.stage('watch_takeout'):
+            watch_takeout(
+                full_path,
+                converter,
+                cmd_args.get('watch_interval') or 2.0,
+                cmd_args.get('watch_idle_timeout'),
+            )
+        return
+
+    shard = cmd_args.get('shard')
     if not main_csv:
-        main_csv = fuse_main_csv(full_path)
+        with profiler.stage('fuse_main_csv'):
+            main_csv = fuse_main_csv(full_path, cmd_args.get('csv_workers'))
         if not main_csv:
             sys.exit(1)
-        output_main_csv(main_csv, full_path)
+        # Shards share the takeout directory, so only the first one writes the main csv.
+        if not shard or shard.index == 0:
+            output_main_csv(main_csv, full_path)
 
-    fused_with_tags = merge_csv_with_filetags(full_path, main_csv, cmd_args.get('dry_run'))
+    with profiler.stage('merge_csv_with_filetags'), throttled_stage(throttle, 'merge_csv_with_filetags'):
+        fused_with_tags = merge_csv_with_filetags(
+            full_path, main_csv, cmd_args.get('dry_run'), io_order, shard, throttle)
     if isinstance(fused_with_tags, tuple):
-        logger.error('Failed to match csv with actual files')
+        failures = match_failures(*fused_with_tags, main_csv)
+        report_path = full_path / match_report_filename(shard)
+        write_match_report(report_path, failures)
+        logger.error('Failed to match csv with actual files. %d failures written to %s',
+                     len(failures), str(report_path))
         sys.exit(1)
 
-    move_audio_files(
-        Path(cmd_args['output_directory']),
-        fused_with_tags,
-        not cmd_args.get('move_files'),
-        cmd_args.get('dry_run'),
-    )
+    output_directory = Path(cmd_args['output_directory'])
+    with profiler.stage('move_audio_files'), throttled_stage(throttle, 'move_audio_files'):
+        transfers = move_audio_files(
+            output_directory,
+            fused_with_tags,
+            not cmd_args.get('move_files'),
+            cmd_args.get('dry_run'),
+            cmd_args.get('verify_transfers'),
+            (cmd_args.get('copy_buffer_size') or COPY_BUFFER_SIZE // 1024) * 1024,
+            cmd_args.get('drop_cache'),
+            io_order,
+            throttle,
+        )
+
+    csv_names = {data.tags.filepath: data.songrecord.original_csv_name for data in fused_with_tags}
+    if shard and transfers is not None:
+        os.makedirs(output_directory, exist_ok=True)
+        write_shard_report(shard, transfers, output_directory, csv_names)
+    elif transfers is not None and not cmd_args.get('dry_run'):
+        # Shards share the output directory, so their shard reports are their record instead.
+        os.makedirs(output_directory, exist_ok=True)
+        write_transfer_record(transfers, output_directory, csv_names)
+
+    # Transfers that failed verification are left out of transfers, and fail the run.
+    if transfers is not None and len(transfers) < len(fused_with_tags):
+        sys.exit(1)
@@ -0,0 +1,179 @@
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+MEGABYTE = 1024 * 1024
+# How often the control file is checked for changes while throttling.
+CONTROL_CHECK_INTERVAL = 1.0
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket refilled at rate tokens per second, holding up to one second of tokens.
+    Requests larger than the bucket are allowed and paid back by waiting, so large files are not starved.
+    A rate of None or 0 means unlimited.
+    '''
+
+    def __init__(self, rate: float = None, clock=time.monotonic, sleep=time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._updated = clock()
+        self.rate = rate or None
+        self._tokens = self.rate or 0.0
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = rate or None
+            self._tokens = min(self._tokens, self.rate or 0.0)
+
+    def _refill(self):
+        now = self._clock()
+        if self.rate:
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float) -> float:
+        '''Take amount tokens, waiting until the bucket is out of debt. Returns the seconds waited.'''
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+@dataclass
+class ThrottleStats:
+    operations: int = 0
+    bytes: int = 0
+    waited: float = 0.0
+
+
+class IOThrottle:
+    '''
+    Limits bandwidth (MB/s) and operations per second across every thread that shares it.
+    Limits can be changed while running through a control file of "mb_per_second = 20" and
+    "ops_per_second = 100" lines, which is re-read when it changes or when the process receives SIGHUP.
+    A limit the file leaves out is kept, and a limit of 0 means unlimited.
+    '''
+
+    def __init__(self, mb_per_second: float = None, ops_per_second: float = None, control_file: Path = None):
+        self.bandwidth = TokenBucket(mb_per_second * MEGABYTE if mb_per_second else None)
+        self.operations = TokenBucket(ops_per_second)
+        self.control_file = control_file
+        self.stats = ThrottleStats()
+        self._stats_lock = threading.Lock()
+        self._control_lock = threading.Lock()
+        self._control_mtime = None
+        self._control_checked = 0.0
+        self._reload_requested = False
+        if control_file:
+            self._load_control_file()
+
+    @property
+    def enabled(self):
+        return bool(self.bandwidth.rate or self.operations.rate or self.control_file)
+
+    def set_limits(self, mb_per_second: float = None, ops_per_second: float = None):
+        self.bandwidth.set_rate(mb_per_second * MEGABYTE if mb_per_second else None)
+        self.operations.set_rate(ops_per_second)
+        logger.info('throttle_limits mb_per_second=%s ops_per_second=%s', mb_per_second, ops_per_second)
+
+    def install_signal_handler(self):
+        '''Reload the control file on SIGHUP. Only possible from the main thread.'''
+        if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, self._request_reload)
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _load_control_file(self):
+        try:
+            mtime = os.stat(self.control_file).st_mtime_ns
+            with open(self.control_file, 'r') as control_in:
+                settings = dict(
+                    (part.strip() for part in line.split('=', 1))
+                    for line in control_in if '=' in line and not line.lstrip().startswith('#')
+                )
+            # Keys left out keep their current limit; 0 removes a limit.
+            limits = {
+                'mb_per_second': self.bandwidth.rate / MEGABYTE if self.bandwidth.rate else None,
+                'ops_per_second': self.operations.rate,
+            }
+            limits.update((key, float(settings[key])) for key in limits if settings.get(key))
+        except (OSError, ValueError) as err:
+            logger.error('Could not read throttle control file %s: %s', str(self.control_file), err)
+            return
+        self._control_mtime = mtime
+        self.set_limits(**limits)
+
+    def _check_control_file(self):
+        now = time.monotonic()
+        if not self._reload_requested and now - self._control_checked < CONTROL_CHECK_INTERVAL:
+            return
+        # One thread checks while the others carry on with the current limits.
+        if not self._control_lock.acquire(blocking=False):
+            return
+        try:
+            self._control_checked = now
+            try:
+                changed = os.stat(self.control_file).st_mtime_ns != self._control_mtime
+            except OSError:
+                changed = False
+            if changed or self._reload_requested:
+                self._reload_requested = False
+                self._load_control_file()
+        finally:
+            self._control_lock.release()
+
+    def operation(self, nbytes: int = 0):
+        '''Account for one I/O operation, e.g. opening a file, waiting as needed.'''
+        self._account(1, nbytes)
+
+    def transfer(self, nbytes: int):
+        '''Account for nbytes of data moved within an operation that was already counted.'''
+        self._account(0, nbytes)
+
+    def _account(self, operations: int, nbytes: int):
+        if self.control_file:
+            self._check_control_file()
+        waited = self.operations.acquire(operations) if operations else 0.0
+        waited += self.bandwidth.acquire(nbytes) if nbytes else 0.0
+        with self._stats_lock:
+            self.stats.operations += operations
+            self.stats.bytes += nbytes
+            self.stats.waited += waited
+
+    @contextmanager
+    def stage(self, name: str):
+        '''Report throttling for everything done within the block, if any limits are set.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.report(name, time.perf_counter() - start)
+
+    def report(self, stage: str, elapsed: float):
+        '''Log what throttling did during a stage and start counting afresh for the next one.'''
+        with self._stats_lock:
+            stats, self.stats = self.stats, ThrottleStats()
+        logger.info(
+            'throttle stage=%s operations=%d mb=%.1f elapsed=%.1fs throttled=%.1fs mb_per_second=%.1f',
+            stage, stats.operations, stats.bytes / MEGABYTE, elapsed, stats.waited,
+            stats.bytes / MEGABYTE / elapsed if elapsed else 0.0,
+        )
+        return stats
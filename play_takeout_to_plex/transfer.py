@@ -0,0 +1,226 @@
+import csv
+import errno
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Large enough to keep per-chunk overhead negligible on 5-10MB audio files.
+COPY_BUFFER_SIZE = 1024 * 1024
+HASH_ALGORITHM = 'sha256'
+MANIFEST_FILENAME = 'transfer_manifest.csv'
+TRANSFER_RECORD_FILENAME = 'transfers.csv'
+# Appended to targets that fail verification: kept for inspection, but not scanned by plex.
+MISMATCH_SUFFIX = '.mismatch'
+# Upper bound per copy_file_range/sendfile call; the kernel may copy less.
+KERNEL_COPY_CHUNK = 64 * 1024 * 1024
+# Errors that mean the in-kernel copy is unsupported for this pair of files, not that the copy failed.
+KERNEL_COPY_FALLBACK_ERRNOS = frozenset(filter(None, [
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.ENOTSUP,
+    getattr(errno, 'EOPNOTSUPP', None), getattr(errno, 'ENOTSOCK', None),
+]))
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TransferResult:
+    origin: Path
+    target: Path
+    source_digest: str
+    target_digest: str
+    moved: bool = False
+
+    @property
+    def verified(self):
+        return self.source_digest == self.target_digest
+
+    def as_row(self):
+        return [
+            str(self.origin),
+            str(self.target),
+            self.source_digest,
+            self.target_digest,
+            'move' if self.moved else 'copy',
+            'ok' if self.verified else 'mismatch',
+        ]
+
+
+def _advise(fd: int, advice_name: str):
+    advice = getattr(os, advice_name, None)
+    if advice is not None and hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, advice)
+
+
+def _drop_behind(infile, outfile):
+    '''Evict the pages of a finished copy so a full library copy does not flush the page cache.'''
+    outfile.flush()
+    if hasattr(os, 'fdatasync'):
+        # Dirty pages can't be dropped, so they have to be written out first.
+        os.fdatasync(outfile.fileno())
+    _advise(infile.fileno(), 'POSIX_FADV_DONTNEED')
+    _advise(outfile.fileno(), 'POSIX_FADV_DONTNEED')
+
+
+def _copy_in_kernel(in_fd: int, out_fd: int, chunk_size: int = KERNEL_COPY_CHUNK, throttle=None) -> bool:
+    '''
+    Copy with copy_file_range, then sendfile, without passing the data through userspace.
+    Returns False if neither is usable for these files, leaving both files rewound.
+    '''
+    for kernel_copy in [getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)]:
+        if kernel_copy is None:
+            continue
+        try:
+            while True:
+                if kernel_copy is os.sendfile:
+                    copied = os.sendfile(out_fd, in_fd, None, chunk_size)
+                else:
+                    copied = kernel_copy(in_fd, out_fd, chunk_size)
+                if not copied:
+                    break
+                if throttle:
+                    throttle.transfer(copied)
+            return True
+        except OSError as err:
+            if err.errno not in KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+            os.lseek(in_fd, 0, os.SEEK_SET)
+            os.lseek(out_fd, 0, os.SEEK_SET)
+            os.ftruncate(out_fd, 0)
+    return False
+
+
+def _copy_buffered(infile, outfile, buffer_size: int, digest=None, throttle=None):
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        read = infile.readinto(buffer)
+        if not read:
+            break
+        if digest is not None:
+            digest.update(view[:read])
+        outfile.write(view[:read])
+        if throttle:
+            throttle.transfer(read)
+
+
+def copy_file(origin: Path,
+              target: Path,
+              buffer_size: int = COPY_BUFFER_SIZE,
+              drop_cache: bool = False,
+              kernel_copy: bool = True,
+              throttle=None):
+    '''
+    Copy the contents of origin to target, like shutil.copyfile.
+    Copies in-kernel where the platform allows, otherwise through a buffer of buffer_size bytes.
+    drop_cache hints sequential access and evicts both files from the page cache afterwards.
+    With a throttle.IOThrottle, the copy is paced in buffer_size chunks.
+    '''
+    # Kernel copies are still chunked when throttled, so bandwidth is spread evenly over the file.
+    chunk_size = buffer_size if throttle else KERNEL_COPY_CHUNK
+    with open(origin, 'rb') as infile, open(target, 'wb') as outfile:
+        if drop_cache:
+            _advise(infile.fileno(), 'POSIX_FADV_SEQUENTIAL')
+        if not (kernel_copy and _copy_in_kernel(infile.fileno(), outfile.fileno(), chunk_size, throttle)):
+            _copy_buffered(infile, outfile, buffer_size, throttle=throttle)
+        if drop_cache:
+            _drop_behind(infile, outfile)
+
+
+def move_file(origin: Path,
+              target: Path,
+              buffer_size: int = COPY_BUFFER_SIZE,
+              drop_cache: bool = False,
+              throttle=None):
+    '''Like shutil.move, but copies across filesystems with copy_file.'''
+    def copy_function(src, dst):
+        copy_file(src, dst, buffer_size, drop_cache, throttle=throttle)
+        shutil.copystat(src, dst)
+
+    shutil.move(origin, target, copy_function=copy_function)
+
+
+def hash_file(path: Path, buffer_size: int = COPY_BUFFER_SIZE, throttle=None) -> str:
+    import hashlib
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(buffer_size), b''):
+            digest.update(chunk)
+            if throttle:
+                throttle.transfer(len(chunk))
+    return digest.hexdigest()
+
+
+def copy_and_hash(origin: Path,
+                  target: Path,
+                  buffer_size: int = COPY_BUFFER_SIZE,
+                  drop_cache: bool = False,
+                  throttle=None) -> str:
+    '''
+    Copy origin to target, hashing the data as it passes through.
+    The source is only read once.
+    '''
+    # Only verified transfers need hashing, so the OpenSSL backed hashlib is imported on demand.
+    import hashlib
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(origin, 'rb') as infile, open(target, 'wb') as outfile:
+        if drop_cache:
+            _advise(infile.fileno(), 'POSIX_FADV_SEQUENTIAL')
+        _copy_buffered(infile, outfile, buffer_size, digest, throttle)
+        if drop_cache:
+            _drop_behind(infile, outfile)
+    return digest.hexdigest()
+
+
+def verified_transfer(origin: Path,
+                      target: Path,
+                      move: bool = False,
+                      buffer_size: int = COPY_BUFFER_SIZE,
+                      drop_cache: bool = False,
+                      throttle=None) -> TransferResult:
+    '''
+    Copy a file and compare the hash of the copied data against a hash of the written target.
+    When moving, the origin is only removed once the target has been verified.
+    A target that fails verification is renamed with MISMATCH_SUFFIX.
+    '''
+    source_digest = copy_and_hash(origin, target, buffer_size, drop_cache, throttle)
+    # With drop_cache the target was evicted after writing, so this re-read comes from storage.
+    target_digest = hash_file(target, buffer_size, throttle)
+    if drop_cache:
+        with open(target, 'rb') as written:
+            _advise(written.fileno(), 'POSIX_FADV_DONTNEED')
+    result = TransferResult(origin, target, source_digest, target_digest)
+    if not result.verified:
+        mismatch_target = target.with_name(target.name + MISMATCH_SUFFIX)
+        os.replace(target, mismatch_target)
+        logger.error('transfer_mismatch origin=%s target=%s', str(origin), str(mismatch_target))
+    elif move:
+        os.unlink(origin)
+        result.moved = True
+    return result
+
+
+def write_manifest(results: List[TransferResult], full_path: Path):
+    with open(full_path / MANIFEST_FILENAME, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['Origin', 'Target', f'Source {HASH_ALGORITHM}', f'Target {HASH_ALGORITHM}',
+                         'Operation', 'Status'])
+        writer.writerows(result.as_row() for result in results)
+
+
+def write_transfer_record(transfers: List[Tuple[Path, Path]],
+                          full_path: Path,
+                          csv_names: Dict[Path, str] = None):
+    '''
+    Record which files a run transferred where, and the takeout csv each was matched with (by origin in
+    csv_names), for later steps such as play2plex-export-plex.
+    '''
+    csv_names = csv_names or {}
+    with open(full_path / TRANSFER_RECORD_FILENAME, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['Origin', 'Target', 'Csv'])
+        writer.writerows([str(origin), str(target), csv_names.get(origin, '')]
+                         for origin, target in transfers)
@@ -0,0 +1,310 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List
+
+from .ingest import ingest_csvs
+from .sharding import Shard, write_shard_report
+from .songs import SongTags, RecordTagLink
+from .takeout_converter import index_main_csv, move_audio_files, output_main_csv, throttled_stage
+from .throttle import IOThrottle
+from .transfer import write_transfer_record
+
+WATCH_PATTERNS = ('*.csv', '*.mp3')
+DEFAULT_POLL_INTERVAL = 2.0
+
+# linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+logger = logging.getLogger(__name__)
+
+
+def _is_takeout_file(path: Path) -> bool:
+    return any(path.match(pattern) for pattern in WATCH_PATTERNS)
+
+
+def _signature(path: Path):
+    '''Size and modification time, or None if the file is gone.'''
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PollingWatcher:
+    '''
+    Reports takeout files in a directory once their size and modification time
+    have stayed the same for a whole poll interval, so partially written files are left alone.
+    '''
+
+    def __init__(self, full_path: Path, interval: float = DEFAULT_POLL_INTERVAL):
+        self.full_path = full_path
+        self.interval = interval
+        self._unsettled = {}
+        self._reported = set()
+
+    def poll(self) -> List[Path]:
+        ready = []
+        for path in self.full_path.iterdir():
+            if path in self._reported or not _is_takeout_file(path):
+                continue
+            signature = _signature(path)
+            if signature is None:
+                continue
+            if self._unsettled.get(path) == signature:
+                del self._unsettled[path]
+                self._reported.add(path)
+                ready.append(path)
+            else:
+                self._unsettled[path] = signature
+        return sorted(ready)
+
+    def changes(self) -> List[Path]:
+        time.sleep(self.interval)
+        return self.poll()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    '''
+    Reports takeout files in a directory as soon as they are closed after writing or moved in to it.
+    Files already present when watching starts may still be being written, so they are reported once
+    closed, or once their size and modification time have stayed the same for a whole interval.
+    If the kernel's event queue overflows, the directory is rescanned and unreported files are settled
+    the same way.
+    Raises OSError where inotify is not available.
+    '''
+
+    def __init__(self, full_path: Path, interval: float = DEFAULT_POLL_INTERVAL):
+        self.full_path = full_path
+        self.interval = interval
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Watch before listing existing files, so nothing landing in between is missed.
+        if libc.inotify_add_watch(self._fd, os.fsencode(full_path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f'inotify_add_watch failed for {full_path}')
+        self._reported = set()
+        self._unsettled = {}
+        self._rescan()
+
+    def _rescan(self):
+        '''Settle every takeout file in the directory that has not been reported yet.'''
+        now = time.monotonic()
+        for path in self.full_path.iterdir():
+            if _is_takeout_file(path) and path not in self._reported and path not in self._unsettled:
+                self._unsettled[path] = (_signature(path), now)
+
+    def _settled(self) -> List[Path]:
+        '''Existing files that have not changed for a whole interval.'''
+        now = time.monotonic()
+        settled = []
+        for path, (signature, since) in list(self._unsettled.items()):
+            current = _signature(path)
+            if current is None:
+                del self._unsettled[path]
+            elif current != signature:
+                self._unsettled[path] = (current, now)
+            elif now - since >= self.interval:
+                del self._unsettled[path]
+                settled.append(path)
+        return sorted(settled)
+
+    def changes(self) -> List[Path]:
+        readable, _, _ = select.select([self._fd], [], [], self.interval)
+        changed = self._read_events() if readable else []
+        for path in changed:
+            self._unsettled.pop(path, None)
+        changed += self._settled()
+        self._reported.update(changed)
+        return changed
+
+    def _read_events(self) -> List[Path]:
+        data = os.read(self._fd, 64 * 1024)
+        changed = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                logger.warning('inotify event queue overflowed, rescanning %s.', str(self.full_path))
+                self._rescan()
+                continue
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            path = self.full_path / os.fsdecode(name)
+            if _is_takeout_file(path) and path not in changed:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(full_path: Path, interval: float = DEFAULT_POLL_INTERVAL):
+    try:
+        return InotifyWatcher(full_path, interval)
+    except OSError as err:
+        logger.warning(
+            'inotify unavailable (%s), polling %s every %.1fs instead.', err, str(full_path), interval)
+        return PollingWatcher(full_path, interval)
+
+
+class IncrementalConverter:
+    '''
+    Matches and transfers takeout files as they arrive.
+    Parsed csv records and audio tags are kept between batches, so every file is only read once,
+    and audio files wait until the csv they match with has arrived.
+    throttle paces tag reads and transfers, and csv_workers spreads csv parsing, as in a batch run.
+    '''
+
+    def __init__(self,
+                 output_directory: Path,
+                 shard: Shard = None,
+                 dry_run: bool = False,
+                 throttle: IOThrottle = None,
+                 csv_workers: int = None,
+                 **transfer_options):
+        self.output_directory = output_directory
+        self.shard = shard
+        self.dry_run = dry_run
+        self.throttle = throttle
+        self.csv_workers = csv_workers
+        self.transfer_options = transfer_options
+        self.seen = set()
+        self.records = []
+        self.lines_by_artist_album = defaultdict(dict)
+        self.waiting_tags = []
+        self.targets = set()
+        self.transfers = []
+        self.csv_names = {}
+        self.duplicates = []
+
+    def add_files(self, paths: List[Path]):
+        paths = [path for path in paths if path not in self.seen]
+        self.seen.update(paths)
+        csv_files = [path for path in paths if path.suffix == '.csv']
+        if csv_files:
+            records, errors = ingest_csvs(csv_files, self.csv_workers)
+            for error in errors:
+                logger.error('csv_row_error file=%s line=%d reason=%s',
+                             error.csv_name, error.line_num, error.reason)
+            for line in index_main_csv(records, self.lines_by_artist_album):
+                logger.error('lost_line csv=%s title=%s', line.original_csv_name, line.title)
+            self.records.extend(records)
+
+        for path in paths:
+            if path.suffix != '.mp3' or (self.shard and not self.shard.includes(path)):
+                continue
+            if self.throttle:
+                self.throttle.operation()
+            tags = SongTags(filepath=path)
+            if not tags.artist or not tags.album:
+                logger.error('lost_audiofile file=%s', path.name)
+            else:
+                self.waiting_tags.append(tags)
+
+    def flush(self):
+        '''Transfer every waiting audio file that now has a matching csv line.'''
+        links = []
+        still_waiting = []
+        for tags in self.waiting_tags:
+            line = self.lines_by_artist_album.get(tags.artist, {}).get(tags.album)
+            if line:
+                links.append(RecordTagLink(songrecord=line, tags=tags, dry_run=self.dry_run))
+            else:
+                still_waiting.append(tags)
+        self.waiting_tags = still_waiting
+
+        # move_audio_files refuses a whole batch with duplicate targets, so only the first file to claim
+        # a target is transferred, whether it was claimed in an earlier batch or earlier in this one.
+        ready = []
+        claimed = set(self.targets)
+        for link in links:
+            target = self.output_directory / link.tags.artist / link.tags.album / link.target_filename
+            if target in claimed:
+                logger.error('duplicate_target file=%s target=%s', link.tags.filepath.name, str(target))
+                self.duplicates.append(link.tags.filepath)
+            else:
+                claimed.add(target)
+                ready.append(link)
+        if not ready:
+            return []
+
+        transfers = move_audio_files(
+            self.output_directory, ready, dry_run=self.dry_run, throttle=self.throttle,
+            **self.transfer_options) or []
+        self.targets.update(target for _, target in transfers)
+        self.transfers.extend(transfers)
+        self.csv_names.update((link.tags.filepath, link.songrecord.original_csv_name) for link in ready)
+        return transfers
+
+    @property
+    def transferred(self):
+        return len(self.transfers)
+
+
+def watch_takeout(full_path: Path,
+                  converter: IncrementalConverter,
+                  interval: float = DEFAULT_POLL_INTERVAL,
+                  idle_timeout: float = None):
+    '''
+    Process takeout files in full_path as they land, until interrupted or nothing new has arrived
+    for idle_timeout seconds. Writes the main csv of everything seen, and the record of what was
+    transferred, on the way out.
+    '''
+    watcher = make_watcher(full_path, interval)
+    last_change = time.monotonic()
+    try:
+        while idle_timeout is None or time.monotonic() - last_change < idle_timeout:
+            changed = watcher.changes()
+            if not changed:
+                continue
+            last_change = time.monotonic()
+            with throttled_stage(converter.throttle, 'watch_batch'):
+                converter.add_files(changed)
+                transfers = converter.flush()
+            logger.info('watch_batch files=%d transferred=%d waiting=%d',
+                        len(changed), len(transfers), len(converter.waiting_tags))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    if converter.duplicates:
+        logger.error('%d audio files were not transferred as their target was already taken: %s',
+                     len(converter.duplicates), str([path.name for path in converter.duplicates]))
+    if converter.waiting_tags:
+        logger.error('%d audio files never matched a csv line: %s', len(converter.waiting_tags),
+                     str([tags.filepath.name for tags in converter.waiting_tags]))
+    if converter.records:
+        output_main_csv(converter.records, full_path)
+    if converter.transfers and converter.shard:
+        os.makedirs(converter.output_directory, exist_ok=True)
+        write_shard_report(
+            converter.shard, converter.transfers, converter.output_directory, converter.csv_names)
+    elif converter.transfers and not converter.dry_run:
+        write_transfer_record(converter.transfers, converter.output_directory, converter.csv_names)
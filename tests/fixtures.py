@@ -82,10 +82,53 @@ for tag, record in zip(AUDIO_TAGS, AUDIO_FILES):
     tag.title = record.tag.title
     tag.album = record.tag.album
     tag.artist = record.tag.artist
-    tag.audiofile = None
 
 
 RECORD_LINKS = [
     RecordTagLink(songrecord=record, tags=tags)
     for record, tags in zip(CSV_RECORDS, AUDIO_TAGS)
 ]
+
+
+# The subset of the plex library database schema that plex_export reads and writes.
+PLEX_SCHEMA = '''
+CREATE TABLE metadata_items (
+    id INTEGER PRIMARY KEY,
+    metadata_type INTEGER,
+    guid VARCHAR(255),
+    title VARCHAR(255)
+);
+CREATE TABLE media_items (id INTEGER PRIMARY KEY, metadata_item_id INTEGER);
+CREATE TABLE media_parts (id INTEGER PRIMARY KEY, media_item_id INTEGER, file VARCHAR(255));
+CREATE TABLE metadata_item_settings (
+    id INTEGER PRIMARY KEY,
+    account_id INTEGER,
+    guid VARCHAR(255),
+    rating FLOAT,
+    view_offset INTEGER,
+    view_count INTEGER,
+    last_viewed_at DATETIME,
+    created_at DATETIME,
+    updated_at DATETIME
+);
+CREATE INDEX index_metadata_item_settings_on_guid ON metadata_item_settings (guid);
+'''
+
+
+def make_plex_db(db_path, files):
+    '''Create a stand-in plex database with one track per file, returning the guid of each.'''
+    import sqlite3
+    guids = [f'plex://track/{i}' for i in range(len(files))]
+    with sqlite3.connect(str(db_path)) as connection:
+        connection.executescript(PLEX_SCHEMA)
+        connection.executemany(
+            'INSERT INTO metadata_items (id, metadata_type, guid) VALUES (?, 10, ?)',
+            enumerate(guids, 1))
+        connection.executemany(
+            'INSERT INTO media_items (id, metadata_item_id) VALUES (?, ?)',
+            ((i, i) for i in range(1, len(files) + 1)))
+        connection.executemany(
+            'INSERT INTO media_parts (media_item_id, file) VALUES (?, ?)',
+            ((i, str(file)) for i, file in enumerate(files, 1)))
+    connection.close()
+    return guids
@@ -0,0 +1,75 @@
+import pytest
+
+from play_takeout_to_plex.songs import SongRecord
+from .fixtures import HEADER_ROW, CSV_RECORDS
+
+
+class TestParseCsvText:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.ingest import parse_csv_text
+        return parse_csv_text
+
+    def test_valid(self, target):
+        records, errors = target(f'{HEADER_ROW}{CSV_RECORDS[1]}\n\n', 'song.csv')
+        assert errors == []
+        assert records == [SongRecord(**{**vars(CSV_RECORDS[1]), 'original_csv_name': 'song.csv'})]
+
+    def test_quoted(self, target):
+        text = HEADER_ROW + '"Hello, Goodbye",1,The Beatles,210000,5,3,\n'
+        records, errors = target(text, 'song.csv')
+        assert errors == []
+        assert (records[0].title, records[0].album, records[0].rating) == ('Hello, Goodbye', '1', 5)
+
+    def test_unescapes(self, target):
+        records, _ = target(HEADER_ROW + 'Track,Burnin&#39;,Bob Marley,282000,0,0,\n', 'song.csv')
+        assert records[0].album == "Burnin'"
+
+    @pytest.mark.parametrize('title', ['Love\u2028Song', 'Love\x0cSong', 'Love\x85Song'])
+    @pytest.mark.parametrize('newline', ['\n', '\r\n'])
+    def test_matches_csv_module(self, title, newline, target):
+        text = (HEADER_ROW + f'{title},Album,Artist,1,2,3,\n').replace('\n', newline)
+        records, errors = target(text, 'song.csv')
+        assert errors == []
+        assert [record.title for record in records] == [title]
+
+    def test_empty(self, target):
+        from play_takeout_to_plex.ingest import RowError
+        assert target('', 'song.csv') == ([], [RowError('song.csv', 1, 'missing header')])
+
+    def test_row_errors(self, target):
+        text = HEADER_ROW + 'Only,Three,Columns\nTitle,Album,Artist,1,2,3,\nTitle,Album,Artist,x,2,3,\n'
+        records, errors = target(text, 'song.csv')
+        assert len(records) == 1
+        assert [(error.line_num, error.reason.split(' ')[0]) for error in errors] == [
+            (2, 'expected'),
+            (4, 'invalid'),
+        ]
+
+
+class TestIngestCsvs:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.ingest import ingest_csvs
+        return ingest_csvs
+
+    @pytest.fixture
+    def csv_files(self, tmp_path):
+        csv_files = []
+        for i, record in enumerate(CSV_RECORDS):
+            csv_file = tmp_path / f'{i}.csv'
+            csv_file.write_text(f'{HEADER_ROW}{record}')
+            csv_files.append(csv_file)
+        return csv_files
+
+    @pytest.mark.parametrize('workers', [1, 3])
+    def test_valid(self, csv_files, workers, target):
+        records, errors = target(csv_files, workers=workers, batch_size=2)
+        assert errors == []
+        assert records == [
+            SongRecord(**{**vars(record), 'original_csv_name': csv_file.name})
+            for record, csv_file in zip(CSV_RECORDS, csv_files)
+        ]
+
+    def test_no_files(self, target):
+        assert target([]) == ([], [])
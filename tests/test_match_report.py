@@ -0,0 +1,109 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from .fixtures import CSV_RECORDS
+from play_takeout_to_plex.songs import SongRecord, SongTags
+
+
+def unmatched_tags(artist, album, title='Lost Song'):
+    tags = SongTags(filepath=Path(f'{artist} - {album} - {title}.mp3'), pull_tags=False)
+    tags.artist = artist
+    tags.album = album
+    tags.title = title
+    tags.track = 1
+    return tags
+
+
+@pytest.fixture
+def lost_line():
+    return SongRecord(title='Lost Line', album='', artist='', duration_ms=123, rating=0, play_count=0,
+                      removed=False, original_csv_name='Lost Line.csv')
+
+
+class TestMatchReportFilename:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.match_report import match_report_filename
+        return match_report_filename
+
+    def test_valid(self, target):
+        from play_takeout_to_plex.sharding import Shard
+        assert target() == 'match_report.db'
+        assert target(Shard(1, 4)) == 'match_report_1_of_4.db'
+
+
+class TestMatchFailures:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.match_report import match_failures
+        return match_failures
+
+    def test_reasons(self, lost_line, target):
+        failures = target(
+            [lost_line],
+            [Path('untagged.mp3')],
+            [
+                unmatched_tags('Bob Marley', 'Unknown Album'),
+                unmatched_tags('Unknown Artist', 'Unknown Album'),
+            ],
+            CSV_RECORDS,
+        )
+        assert [(failure.reason, failure.source) for failure in failures] == [
+            ('csv_missing_artist_album', 'csv'),
+            ('tag_missing_artist_album', 'audiofile'),
+            ('no_csv_album', 'audiofile'),
+            ('no_csv_artist', 'audiofile'),
+        ]
+        assert failures[0].csv_name == 'Lost Line.csv'
+        assert failures[1].file == 'untagged.mp3'
+        assert failures[2].file == 'Bob Marley - Unknown Album - Lost Song.mp3'
+
+
+class TestWriteMatchReport:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.match_report import write_match_report
+        return write_match_report
+
+    @pytest.fixture
+    def failures(self, lost_line):
+        from play_takeout_to_plex.match_report import match_failures
+        return match_failures(
+            [lost_line],
+            [Path('untagged.mp3')],
+            [unmatched_tags('Bob Marley', f'Album {index}') for index in range(3)],
+            CSV_RECORDS,
+        )
+
+    def test_valid(self, tmp_path, failures, target):
+        db_path = tmp_path / 'match_report.db'
+        target(db_path, failures)
+
+        connection = sqlite3.connect(str(db_path))
+        try:
+            assert connection.execute('SELECT COUNT(*) FROM match_failures').fetchone() == (5,)
+            assert sorted(connection.execute('SELECT reason, source, failures FROM match_summary')) == [
+                ('csv_missing_artist_album', 'csv', 1),
+                ('no_csv_album', 'audiofile', 3),
+                ('tag_missing_artist_album', 'audiofile', 1),
+            ]
+            plan = connection.execute(
+                'EXPLAIN QUERY PLAN SELECT file FROM match_failures WHERE artist = ? AND album = ?',
+                ('Bob Marley', 'Album 1'),
+            ).fetchall()
+            assert 'match_failures_artist_album_title' in str(plan)
+        finally:
+            connection.close()
+
+    def test_replaces_earlier_report(self, tmp_path, failures, target):
+        db_path = tmp_path / 'match_report.db'
+        target(db_path, failures)
+        target(db_path, failures[:1])
+
+        connection = sqlite3.connect(str(db_path))
+        try:
+            assert connection.execute('SELECT COUNT(*) FROM match_failures').fetchone() == (1,)
+        finally:
+            connection.close()
@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def sources(tmp_path):
+    sources = []
+    for name in ['c.mp3', 'a.mp3', 'd.mp3', 'b.mp3']:
+        source = tmp_path / name
+        source.write_bytes(b'ID3' * 2000)
+        sources.append(source)
+    return sources
+
+
+def inode_order(paths):
+    return sorted(paths, key=lambda path: os.stat(path).st_ino)
+
+
+class TestOrderReads:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.ordering import order_reads
+        return order_reads
+
+    def test_glob_keeps_order(self, target):
+        paths = [Path('b'), Path('a'), Path('c')]
+        assert target(iter(paths), 'glob') == paths
+
+    def test_inode(self, sources, target):
+        assert target(reversed(sources), 'inode') == inode_order(sources)
+
+    def test_physical(self, mocker, sources, target):
+        offsets = {source: offset for source, offset in zip(sources, [300, None, 100, 200])}
+        mocker.patch('play_takeout_to_plex.ordering.physical_offset', side_effect=offsets.get)
+        assert target(sources, 'physical') == [sources[2], sources[3], sources[0], sources[1]]
+
+
+class TestOrderTransfers:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.ordering import order_transfers
+        return order_transfers
+
+    @pytest.fixture
+    def transfers(self, sources):
+        albums = [Path('out/Artist/B'), Path('out/Artist/A'), Path('out/Artist/B'), Path('out/Artist/A')]
+        return [(source, album / source.name) for source, album in zip(sources, albums)]
+
+    def test_glob_keeps_order(self, transfers, target):
+        assert target(iter(transfers), 'glob') == transfers
+
+    def test_inode(self, transfers, target):
+        expect = inode_order([origin for origin, _ in transfers])
+        assert [origin for origin, _ in target(transfers, 'inode')] == expect
+
+    def test_destination_groups_by_album(self, transfers, target):
+        res = target(transfers, 'destination')
+        assert [target.parent for _, target in res] == [Path('out/Artist/A')] * 2 + [Path('out/Artist/B')] * 2
+        for album in ['A', 'B']:
+            origins = [origin for origin, target in res if target.parent.name == album]
+            assert origins == inode_order(origins)
+
+
+class TestPhysicalOffset:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.ordering import physical_offset
+        return physical_offset
+
+    def test_missing_file(self, tmp_path, target):
+        assert target(tmp_path / 'missing.mp3') is None
+
+    def test_unsupported(self, mocker, sources, target):
+        mocker.patch('play_takeout_to_plex.ordering.fcntl', None)
+        assert target(sources[0]) is None
+
+    def test_valid(self, sources, target):
+        offset = target(sources[0])
+        assert offset is None or isinstance(offset, int)
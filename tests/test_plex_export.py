@@ -0,0 +1,214 @@
+import logging
+import sqlite3
+from copy import deepcopy
+from pathlib import Path
+
+import pytest
+
+from play_takeout_to_plex.songs import SongRecord
+from .fixtures import HEADER_ROW, CSV_RECORDS, make_plex_db
+
+PLEX_FILES = [Path(f'/music/{record.artist}/{record.album}/{record.title}') for record in CSV_RECORDS]
+
+
+def settings(db_path):
+    with sqlite3.connect(str(db_path)) as connection:
+        rows = connection.execute(
+            'SELECT account_id, guid, rating, view_count FROM metadata_item_settings ORDER BY guid',
+        ).fetchall()
+    connection.close()
+    return rows
+
+
+class TestPlexRating:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.plex_export import plex_rating
+        return plex_rating
+
+    @pytest.mark.parametrize('rating,expect', [(0, None), (1, 2), (3, 6), (5, 10)])
+    def test_valid(self, rating, expect, target):
+        assert target(rating) == expect
+
+
+class TestExportToPlexDb:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.plex_export import export_to_plex_db
+        return export_to_plex_db
+
+    @pytest.fixture
+    def records(self):
+        records = deepcopy(CSV_RECORDS)
+        records[0].rating = 5
+        records[1].rating = 1
+        return records
+
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        db_path = tmp_path / 'com.plexapp.plugins.library.db'
+        make_plex_db(db_path, PLEX_FILES)
+        return db_path
+
+    def test_inserts(self, db_path, records, target):
+        result = target(db_path, zip(PLEX_FILES, records), batch_size=3)
+
+        assert (result.inserted, result.updated, result.missing) == (len(records), 0, [])
+        assert settings(db_path) == sorted(
+            (1, f'plex://track/{i}', record.rating * 2 or None, record.play_count)
+            for i, record in enumerate(records)
+        )
+
+    def test_updates_keep_plex_values(self, db_path, records, target):
+        with sqlite3.connect(str(db_path)) as connection:
+            connection.executemany(
+                'INSERT INTO metadata_item_settings (account_id, guid, rating, view_count) '
+                'VALUES (1, ?, ?, ?)',
+                [('plex://track/0', 4, 100), ('plex://track/2', 8, 0)])
+        connection.close()
+
+        result = target(db_path, zip(PLEX_FILES[:3], records[:3]))
+
+        assert (result.inserted, result.updated) == (1, 2)
+        assert settings(db_path) == [
+            (1, 'plex://track/0', 10, 100),  # takeout rating, plex's higher play count
+            (1, 'plex://track/1', 2, 0),
+            (1, 'plex://track/2', 8, 1),  # unrated in takeout, plex rating kept
+        ]
+
+    def test_other_account(self, db_path, records, target):
+        result = target(db_path, zip(PLEX_FILES[:1], records[:1]), account_id=2)
+        assert result.inserted == 1
+        assert settings(db_path)[0][0] == 2
+
+    def test_missing(self, db_path, records, target):
+        missing = Path('/music/not/scanned.mp3')
+        result = target(db_path, [(missing, records[0]), (PLEX_FILES[1], records[1])])
+        assert (result.inserted, result.missing) == (1, [missing])
+
+
+@pytest.fixture
+def album_transfers(tmp_path):
+    '''Two tracks of one album, transferred from a takeout directory that still holds their csvs.'''
+    takeout_directory = tmp_path / 'Tracks'
+    takeout_directory.mkdir()
+    records = [
+        SongRecord(title='One', album='Album', artist='Artist', duration_ms=1000, rating=5, play_count=3,
+                   removed=False, original_csv_name='One.csv'),
+        SongRecord(title='Two', album='Album', artist='Artist', duration_ms=1000, rating=1, play_count=99,
+                   removed=False, original_csv_name='Two.csv'),
+    ]
+    for record in records:
+        (takeout_directory / record.original_csv_name).write_text(f'{HEADER_ROW}{record}\n')
+    transfers = [
+        (Path('Tracks/Artist - Album - One.mp3'), Path('out/Artist/Album/01 - One.mp3')),
+        (Path('Tracks/Artist - Album - Two.mp3'), Path('out/Artist/Album/02 - Two.mp3')),
+    ]
+    csv_names = {origin: record.original_csv_name for (origin, _), record in zip(transfers, records)}
+    return takeout_directory, transfers, csv_names, records
+
+
+class TestReadTransferRecord:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.plex_export import read_transfer_record
+        return read_transfer_record
+
+    def test_transfer_record(self, tmp_path, album_transfers, target):
+        from play_takeout_to_plex.transfer import write_transfer_record
+        _, transfers, csv_names, _ = album_transfers
+        write_transfer_record(transfers, tmp_path, csv_names)
+        assert target(tmp_path / 'transfers.csv') == [
+            (Path('out/Artist/Album/01 - One.mp3'), 'One.csv'),
+            (Path('out/Artist/Album/02 - Two.mp3'), 'Two.csv'),
+        ]
+
+    def test_shard_report(self, tmp_path, album_transfers, target):
+        from play_takeout_to_plex.sharding import Shard, write_shard_report
+        _, transfers, csv_names, _ = album_transfers
+        write_shard_report(Shard(0, 2), transfers, tmp_path, csv_names)
+        assert [csv_name for _, csv_name in target(tmp_path / 'shard_0_of_2.csv')] == ['One.csv', 'Two.csv']
+
+    def test_no_csv_column(self, tmp_path, target):
+        from play_takeout_to_plex.transfer import TransferResult, write_manifest
+        write_manifest([TransferResult(Path('a.mp3'), Path('out/A/B/a.mp3'), 'abc', 'abc')], tmp_path)
+        with pytest.raises(ValueError):
+            target(tmp_path / 'transfer_manifest.csv')
+
+
+class TestMatchTransferredFiles:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.plex_export import match_transferred_files
+        return match_transferred_files
+
+    def test_tracks_of_one_album(self, mocker, album_transfers, target):
+        takeout_directory, transfers, csv_names, records = album_transfers
+        eyed3 = mocker.patch('play_takeout_to_plex.songs.eyed3')
+        matched, unmatched = target(
+            takeout_directory, [(target_path, csv_names[origin]) for origin, target_path in transfers])
+
+        assert matched == [
+            (Path('Artist/Album/01 - One.mp3'), records[0]),
+            (Path('Artist/Album/02 - Two.mp3'), records[1]),
+        ]
+        assert unmatched == []
+        eyed3.load.assert_not_called()
+
+    def test_unmatched(self, album_transfers, target):
+        takeout_directory, transfers, csv_names, records = album_transfers
+        (takeout_directory / 'Two.csv').unlink()
+        matched, unmatched = target(takeout_directory, [
+            (transfers[0][1], 'One.csv'),
+            (transfers[1][1], 'Two.csv'),
+            (Path('out/A/B/unrecorded.mp3'), ''),
+        ])
+        assert matched == [(Path('Artist/Album/01 - One.mp3'), records[0])]
+        assert unmatched == [transfers[1][1], Path('out/A/B/unrecorded.mp3')]
+
+
+class TestMain:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.plex_export import main
+        return main
+
+    @pytest.fixture
+    def run(self, mocker, album_transfers, tmp_path):
+        from play_takeout_to_plex.transfer import write_transfer_record
+        takeout_directory, transfers, csv_names, _ = album_transfers
+        output_directory = tmp_path / 'out'
+        output_directory.mkdir()
+        write_transfer_record(transfers, output_directory, csv_names)
+        db_path = tmp_path / 'com.plexapp.plugins.library.db'
+        make_plex_db(db_path, [Path('/data/music') / Path(*target.parts[1:]) for _, target in transfers])
+
+        def run(target):
+            mocker.patch('sys.argv', [
+                'play2plex-export-plex', str(output_directory), str(takeout_directory), str(db_path),
+                '--plex-music-directory', '/data/music',
+            ])
+            target()
+        yield run, db_path
+        logging.getLogger('play_takeout_to_plex').setLevel(logging.NOTSET)
+
+    def test_valid(self, run, target):
+        run, db_path = run
+        run(target)
+        # Each track gets the rating and play count of its own csv line, not another track of the album.
+        assert settings(db_path) == [
+            (1, 'plex://track/0', 10, 3),
+            (1, 'plex://track/1', 2, 99),
+        ]
+
+    def test_missing_fails(self, mocker, run, target):
+        run, db_path = run
+        with sqlite3.connect(str(db_path)) as connection:
+            connection.execute("DELETE FROM media_parts WHERE file LIKE '%Two.mp3'")
+        connection.close()
+        mock_logger = mocker.patch('play_takeout_to_plex.plex_export.logger')
+        with pytest.raises(SystemExit):
+            run(target)
+
+        assert [row[1] for row in settings(db_path)] == ['plex://track/0']
+        assert mock_logger.error.called
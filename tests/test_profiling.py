@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+
+def busy_stage(duration=0.1):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+class TestStageProfiler:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.profiling import StageProfiler
+        return StageProfiler
+
+    def test_disabled(self, tmp_path, target):
+        profile_directory = tmp_path / 'profile'
+        with target(None, profile_directory).stage('stage'):
+            busy_stage(0)
+        assert not profile_directory.exists()
+
+    def test_cprofile(self, tmp_path, target):
+        import pstats
+        with target('cprofile', tmp_path, top=5).stage('stage'):
+            busy_stage()
+
+        assert pstats.Stats(str(tmp_path / 'stage.prof')).total_calls
+        summary = (tmp_path / 'stage.txt').read_text()
+        assert summary.startswith('stage=stage mode=cprofile elapsed=')
+        assert 'busy_stage' in summary
+
+    def test_sample(self, tmp_path, target):
+        with target('sample', tmp_path, top=5).stage('stage'):
+            busy_stage()
+
+        folded = (tmp_path / 'stage.folded').read_text().splitlines()
+        assert folded
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in folded)
+        summary = (tmp_path / 'stage.txt').read_text()
+        assert summary.startswith('stage=stage mode=sample elapsed=')
+        assert 'busy_stage' in summary
+
+    @pytest.mark.parametrize('mode', ['cprofile', 'sample'])
+    def test_writes_on_error(self, tmp_path, mode, target):
+        with pytest.raises(SystemExit):
+            with target(mode, tmp_path).stage('stage'):
+                busy_stage(0.02)
+                raise SystemExit(1)
+        assert (tmp_path / 'stage.txt').exists()
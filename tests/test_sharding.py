@@ -0,0 +1,100 @@
+import argparse
+from pathlib import Path
+
+import pytest
+
+AUDIOFILES = [
+    Path(f'Tracks/{artist} - Album {album} - Track {track}.mp3')
+    for artist in ['Bob Marley', 'OK Go', 'Porcupine Tree', 'Weird Al Yankovic', 'Queen', 'ABBA']
+    for album in range(3)
+    for track in range(4)
+]
+
+
+class TestShard:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.sharding import Shard
+        return Shard
+
+    @pytest.mark.parametrize('count', [1, 2, 3, 7])
+    def test_partitions_files(self, count, target):
+        shards = [target(index, count) for index in range(count)]
+        for audiofile in AUDIOFILES:
+            assert sum(shard.includes(audiofile) for shard in shards) == 1
+
+    def test_artist_stays_together(self, target):
+        shard = target(1, 3)
+        by_artist = {}
+        for audiofile in AUDIOFILES:
+            by_artist.setdefault(audiofile.name.split(' - ')[0], set()).add(shard.includes(audiofile))
+        assert all(len(included) == 1 for included in by_artist.values())
+
+    @pytest.mark.parametrize('index,count', [(-1, 2), (2, 2), (0, 0)])
+    def test_invalid(self, index, count, target):
+        with pytest.raises(ValueError):
+            target(index, count)
+
+
+class TestParseShard:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.sharding import parse_shard
+        return parse_shard
+
+    def test_valid(self, target):
+        from play_takeout_to_plex.sharding import Shard
+        assert target('2/8') == Shard(2, 8)
+
+    @pytest.mark.parametrize('value', ['2', '8/8', 'a/b', '1/2/3', ''])
+    def test_invalid(self, value, target):
+        with pytest.raises(argparse.ArgumentTypeError):
+            target(value)
+
+
+class TestMergeShardReports:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.sharding import merge_shard_reports
+        return merge_shard_reports
+
+    @pytest.fixture
+    def write_reports(self, tmp_path):
+        from play_takeout_to_plex.sharding import Shard, write_shard_report
+
+        def write(transfers_by_shard):
+            count = len(transfers_by_shard)
+            for index, transfers in enumerate(transfers_by_shard):
+                if transfers is not None:
+                    csv_names = {origin: f'{origin.stem}.csv' for origin, _ in transfers}
+                    write_shard_report(Shard(index, count), transfers, tmp_path, csv_names)
+
+        return write
+
+    def test_valid(self, tmp_path, write_reports, target):
+        write_reports([
+            [(Path('a.mp3'), Path('out/A/A/01 - a.mp3'))],
+            [(Path('b.mp3'), Path('out/B/B/01 - b.mp3')), (Path('c.mp3'), Path('out/B/B/02 - c.mp3'))],
+        ])
+        assert target(tmp_path, 2) == ([], {})
+        lines = (tmp_path / 'shard_report.csv').read_text().splitlines()
+        assert lines == [
+            'Shard,Origin,Target,Csv',
+            '0/2,a.mp3,out/A/A/01 - a.mp3,a.csv',
+            '1/2,b.mp3,out/B/B/01 - b.mp3,b.csv',
+            '1/2,c.mp3,out/B/B/02 - c.mp3,c.csv',
+        ]
+
+    def test_collisions(self, tmp_path, write_reports, target):
+        write_reports([
+            [(Path('a.mp3'), Path('out/A/A/01 - a.mp3'))],
+            [(Path('b.mp3'), Path('out/a/a/01 - A.mp3'))],
+            [(Path('c.mp3'), Path('out/C/C/01 - c.mp3'))],
+        ])
+        missing, collisions = target(tmp_path, 3)
+        assert missing == []
+        assert collisions == {'out/A/A/01 - a.mp3': ['0/3', '1/3']}
+
+    def test_missing_shards(self, tmp_path, write_reports, target):
+        write_reports([[], None, []])
+        assert target(tmp_path, 3) == ([1], {})
@@ -62,6 +62,33 @@ class TestSongTags:
         mocker.patch('play_takeout_to_plex.songs.eyed3.load', return_value=mocktags)
         assert target(filepath=Path('test')).has_title_extension is expect
 
+    def test_derived_properties_invalidated_on_title_change(self, mocker, target):
+        mocktags = MockAudiofile(tag=MockAudiofileTags(
+            track_num=9,
+            title='05 - Track Title',
+            album='Test Album',
+            artist='Test Artist',
+        ))
+        mocker.patch('play_takeout_to_plex.songs.eyed3.load', return_value=mocktags)
+        tags = target(filepath=Path('test'))
+        assert (tags.title_track_num, tags.has_title_extension) == (5, False)
+
+        tags.title = 'Track Title.mp3'
+        assert (tags.title_track_num, tags.has_title_extension) == (None, True)
+
+    def test_audiofile_not_retained(self, mocker, target):
+        mocktags = MockAudiofile(tag=MockAudiofileTags(
+            track_num=(9, 12),
+            title='Track Title',
+            album='Test Album',
+            artist='Test Artist',
+        ))
+        mocker.patch('play_takeout_to_plex.songs.eyed3.load', return_value=mocktags)
+        tags = target(filepath=Path('test'))
+
+        assert tags.track == 9
+        assert mocktags not in vars(tags).values()
+
 
 class TestRecordTagLink:
     @pytest.fixture
@@ -100,12 +127,21 @@ class TestRecordTagLink:
         )
 
     @pytest.mark.parametrize('dry_run', [True, False])
-    def test_init_sets_values_valid(self, mocker, tags, songrecord, dry_run, target):
+    def test_init_sets_values_valid(self, mocker, audiofile, tags, songrecord, dry_run, target):
         tags.track = None
+        audiofile.tag.track_num = None
         target(songrecord=songrecord, tags=tags, dry_run=dry_run)
 
         assert tags.track == 7
-        assert len(tags.audiofile.tag.save.mock_calls) == 0 if dry_run else 1
+        assert audiofile.tag.track_num == (None if dry_run else 7)
+        assert len(audiofile.tag.save.mock_calls) == (0 if dry_run else 1)
+
+    def test_init_no_update_does_not_reopen(self, mocker, audiofile, tags, songrecord, target):
+        load = mocker.patch('play_takeout_to_plex.songs.eyed3.load', return_value=audiofile)
+        target(songrecord=songrecord, tags=tags, dry_run=False)
+
+        load.assert_not_called()
+        audiofile.tag.save.assert_not_called()
 
     @pytest.mark.parametrize('original,expect', [
         ('08 - Open Car', '08 - Open Car'),
@@ -118,3 +154,23 @@ class TestRecordTagLink:
         tags.title = tags.filepath.name
         songrecord.title = tags.title
         assert target(songrecord=songrecord, tags=tags).target_filename == expect
+
+    def test_target_filename_cached(self, mocker, tags, songrecord, target):
+        link = target(songrecord=songrecord, tags=tags)
+        build = mocker.spy(link, '_build_target_filename')
+        assert link.target_filename == '07 - Open Car.mp3'
+        assert link.target_filename == '07 - Open Car.mp3'
+        assert build.call_count == 1
+
+    def test_target_filename_invalidated_on_tag_change(self, tags, songrecord, target):
+        link = target(songrecord=songrecord, tags=tags)
+        assert link.target_filename == '07 - Open Car.mp3'
+
+        tags.title = '09 - Open Car.flac'
+        assert tags.title_track_num == 9
+        assert tags.has_title_extension is True
+        assert link.target_filename == '09 - Open Car.flac'
+
+        tags.title = 'Open Car'
+        tags.track = 3
+        assert link.target_filename == '03 - Open Car.mp3'
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time of the package, in microseconds. Currently well under half of this.
+IMPORT_BUDGET_US = 150_000
+# Only needed once the matching stage runs: reading tags and parallel csv parsing.
+LAZY_MODULES = {'eyed3', 'multiprocessing', 'concurrent.futures.process'}
+
+
+def importtime(code, *args):
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code, *args],
+        capture_output=True,
+        text=True,
+    )
+    timings = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        timings[module.strip()] = int(cumulative)
+    return timings
+
+
+@pytest.mark.parametrize('code,args', [
+    ('import play_takeout_to_plex', []),
+    ('from play_takeout_to_plex import main; main()', ['--help']),
+    ('from play_takeout_to_plex import main; main()', ['--shard', 'invalid']),
+])
+def test_cli_does_not_import_heavy_modules(code, args):
+    timings = importtime(code, *args)
+    assert 'play_takeout_to_plex.takeout_converter' in timings
+    assert not LAZY_MODULES & set(timings)
+
+
+def test_import_time_budget():
+    # Best of a few runs, to keep a busy machine from failing the budget.
+    best = min(importtime('import play_takeout_to_plex')['play_takeout_to_plex'] for _ in range(3))
+    assert best < IMPORT_BUDGET_US
+
+
+def test_eyed3_loaded_on_use():
+    from play_takeout_to_plex import songs
+    import eyed3
+    assert songs.eyed3 is eyed3
@@ -1,9 +1,11 @@
+import logging
 from unittest.mock import call
 from copy import deepcopy
 from io import StringIO
 from pathlib import Path
 
 import pytest
+from play_takeout_to_plex import watch
 from play_takeout_to_plex.songs import RecordTagLink, SongTags, SongRecord
 from .fixtures import (
     HEADER_ROW,
@@ -47,22 +49,47 @@ class TestFuseMainCsv:
         from play_takeout_to_plex.takeout_converter import fuse_main_csv
         return fuse_main_csv
 
+    @pytest.fixture
+    def mock_csv_dir(self, mocker):
+        def with_context(side_effect):
+            mock_open = mocker.MagicMock()
+            mock_open.return_value.__enter__.side_effect = side_effect
+            mocker.patch('play_takeout_to_plex.ingest.open', mock_open)
+            return mock_open
+
+        return with_context
+
     def test_fuse_main_csv_valid(self, mock_path, mock_csv_dir, target):
         mock_csv_dir(CSV_FILES)
         res = target(mock_path)
         assert res == CSV_RECORDS
 
     def test_fuse_main_csv_no_header(self, mock_path, mock_csv_dir, mock_logger, target):
+        mock_path.glob.return_value = [mock_path]
         mock_csv_dir([StringIO('')])
         res = target(mock_path)
-        assert res is None
-        mock_logger.error.assert_called_with('All csv files must begin with header')
+        assert res == []
+        mock_logger.error.assert_called_with(
+            'csv_row_error file=%s line=%d reason=%s', '', 1, 'missing header')
 
     def test_fuse_main_csv_invalid_format(self, mock_path, mock_csv_dir, mock_logger, target):
+        mock_path.glob.return_value = [mock_path]
         mock_csv_dir([StringIO(HEADER_ROW + str(CSV_RECORDS[0]) + 'extra,columns.raise,errors')])
         res = target(mock_path)
-        assert res is None
-        mock_logger.error.assert_called_with('CSV files are not in expected format.')
+        assert res == []
+        mock_logger.error.assert_called_with(
+            'csv_row_error file=%s line=%d reason=%s', '', 2, 'expected 7 columns, got 9')
+
+    def test_fuse_main_csv_keeps_valid_rows(self, mock_path, mock_csv_dir, mock_logger, target):
+        mock_path.glob.return_value = [mock_path] * 3
+        mock_csv_dir([
+            StringIO(f'{HEADER_ROW}{CSV_RECORDS[0]}'),
+            StringIO(f'{HEADER_ROW}Title,Album,Artist,notanumber,0,0,'),
+            StringIO(f'{HEADER_ROW}{CSV_RECORDS[1]}'),
+        ])
+        res = target(mock_path)
+        assert res == CSV_RECORDS[:2]
+        assert mock_logger.error.call_count == 1
 
 
 class TestOutputMainCsv:
@@ -137,6 +164,25 @@ class TestMergeCsvWithFiletags:
         assert lost_audiofiles == []
         assert unmatched_audiofiles
 
+    def test_shard_filters_files(self, mock_eyed3, mock_path, target):
+        from play_takeout_to_plex.sharding import Shard
+        audiofiles = [Path(f'{tag.artist} - {tag.album} - {tag.title}.mp3')
+                      for tag in (audiofile.tag for audiofile in AUDIO_FILES)]
+        mock_eyed3.load.side_effect = lambda path: AUDIO_FILES[audiofiles.index(path)]
+        mock_path.glob.return_value = audiofiles
+        shard = Shard(0, 2)
+
+        res = target(mock_path, CSV_RECORDS, False, shard=shard)
+        assert [link.tags.filepath for link in res] == [path for path in audiofiles if shard.includes(path)]
+
+    def test_throttle_paces_tag_reads(self, mocker, mock_eyed3, mock_path, target):
+        mock_eyed3.load.side_effect = AUDIO_FILES * 2
+        mock_path.glob.return_value = [''] * len(AUDIO_FILES)
+        throttle = mocker.Mock()
+
+        target(mock_path, CSV_RECORDS, False, throttle=throttle)
+        assert throttle.operation.call_count == len(AUDIO_FILES)
+
 
 class TestMoveAudioFiles:
     @pytest.fixture
@@ -145,8 +191,12 @@ class TestMoveAudioFiles:
         return move_audio_files
 
     @pytest.fixture
-    def mock_shutil(self, mocker):
-        return mocker.patch('play_takeout_to_plex.takeout_converter.shutil')
+    def mock_move_file(self, mocker):
+        return mocker.patch('play_takeout_to_plex.takeout_converter.move_file')
+
+    @pytest.fixture
+    def mock_copy_file(self, mocker):
+        return mocker.patch('play_takeout_to_plex.takeout_converter.copy_file')
 
     @pytest.fixture
     def expect_out_filenames(self):
@@ -179,30 +229,130 @@ class TestMoveAudioFiles:
             in zip(expect_in_filenames, expect_out_filenames)
         ]
 
-    def test_move_valid(self, mock_shutil, expect_calls, target):
+    def test_move_valid(self, mock_move_file, mock_copy_file, expect_calls, target):
         outpath = Path('testpath')
         target(
             target_path=outpath,
             tagged_data=RECORD_LINKS,
             copy=False,
             dry_run=False,
+            buffer_size=8192,
+            drop_cache=True,
         )
-        assert mock_shutil.move.mock_calls == expect_calls
-        mock_shutil.copy.assert_not_called()
+        assert mock_move_file.mock_calls == [
+            call(*expect.args, buffer_size=8192, drop_cache=True, throttle=None) for expect in expect_calls
+        ]
+        mock_copy_file.assert_not_called()
+
+    def test_copy_valid(self,
+                        mock_move_file,
+                        mock_copy_file,
+                        expect_in_filenames,
+                        expect_out_filenames,
+                        target):
+        outpath = Path('testpath')
+        target(
+            target_path=outpath,
+            tagged_data=RECORD_LINKS,
+            copy=True,
+            dry_run=False,
+            buffer_size=8192,
+            drop_cache=True,
+        )
+        assert mock_copy_file.mock_calls == [
+            call(origin, out, buffer_size=8192, drop_cache=True, throttle=None)
+            for origin, out in zip(expect_in_filenames, expect_out_filenames)
+        ]
+        mock_move_file.assert_not_called()
 
-    def test_copy_valid(self, mock_shutil, expect_calls, target):
+    @pytest.mark.parametrize('copy', [True, False])
+    def test_verify_valid(self,
+                          mocker,
+                          mock_move_file,
+                          mock_copy_file,
+                          expect_in_filenames,
+                          expect_out_filenames,
+                          copy,
+                          target):
+        from play_takeout_to_plex.transfer import TransferResult
+        mock_transfer = mocker.patch(
+            'play_takeout_to_plex.takeout_converter.verified_transfer',
+            side_effect=lambda origin, target, move, **_: TransferResult(origin, target, 'abc', 'abc', move),
+        )
+        mock_manifest = mocker.patch('play_takeout_to_plex.takeout_converter.write_manifest')
         outpath = Path('testpath')
         target(
             target_path=outpath,
             tagged_data=RECORD_LINKS,
+            copy=copy,
+            dry_run=False,
+            verify=True,
+        )
+
+        assert mock_transfer.mock_calls == [
+            call(origin, out, move=not copy, buffer_size=1024 * 1024, drop_cache=False, throttle=None)
+            for origin, out in zip(expect_in_filenames, expect_out_filenames)
+        ]
+        results, manifest_path = mock_manifest.call_args[0]
+        assert len(results) == len(RECORD_LINKS)
+        assert manifest_path == outpath
+        mock_move_file.assert_not_called()
+        mock_copy_file.assert_not_called()
+
+    def test_verify_mismatch_left_out(self, mocker, mock_move_file, mock_copy_file, expect_calls, target):
+        from play_takeout_to_plex.transfer import TransferResult
+        mismatch = expect_calls[0].args[0]
+        mocker.patch(
+            'play_takeout_to_plex.takeout_converter.verified_transfer',
+            side_effect=lambda origin, target, **_: TransferResult(
+                origin, target, 'abc', 'def' if origin == mismatch else 'abc'),
+        )
+        mocker.patch('play_takeout_to_plex.takeout_converter.write_manifest')
+        transfers = target(
+            target_path=Path('testpath'),
+            tagged_data=RECORD_LINKS,
             copy=True,
             dry_run=False,
+            verify=True,
         )
-        assert mock_shutil.copyfile.mock_calls == expect_calls
-        mock_shutil.move.assert_not_called()
+        assert transfers == [expect.args for expect in expect_calls[1:]]
+
+    def test_io_order_valid(self, mocker, mock_move_file, mock_copy_file, expect_calls, target):
+        order = mocker.patch('play_takeout_to_plex.takeout_converter.order_transfers',
+                             side_effect=lambda transfers, io_order: list(reversed(list(transfers))))
+        target(
+            target_path=Path('testpath'),
+            tagged_data=RECORD_LINKS,
+            copy=False,
+            dry_run=False,
+            io_order='destination',
+        )
+        assert order.call_args[0][1] == 'destination'
+        assert [move.args for move in mock_move_file.mock_calls] == [
+            expect.args for expect in reversed(expect_calls)]
+
+    @pytest.mark.parametrize('copy', [True, False])
+    def test_throttle_valid(self, mocker, mock_move_file, mock_copy_file, expect_calls, copy, target):
+        throttle = mocker.Mock()
+        target(
+            target_path=Path('testpath'),
+            tagged_data=RECORD_LINKS,
+            copy=copy,
+            dry_run=False,
+            throttle=throttle,
+        )
+
+        assert throttle.operation.call_count == len(RECORD_LINKS)
+        expect_command, unused_command = (
+            (mock_copy_file, mock_move_file) if copy else (mock_move_file, mock_copy_file))
+        assert expect_command.mock_calls == [
+            call(*expect.args, buffer_size=1024 * 1024, drop_cache=False, throttle=throttle)
+            for expect in expect_calls
+        ]
+        unused_command.assert_not_called()
 
     @pytest.mark.parametrize('copy', [True, False])
-    def test_dry_run_valid(self, mock_shutil, expect_calls, copy, target):
+    def test_dry_run_valid(self, mock_move_file, mock_copy_file, expect_calls, copy, target):
         outpath = Path('testpath')
         target(
             target_path=outpath,
@@ -211,11 +361,11 @@ class TestMoveAudioFiles:
             dry_run=True,
         )
 
-        mock_shutil.move.assert_not_called()
-        mock_shutil.copyfile.assert_not_called()
+        mock_move_file.assert_not_called()
+        mock_copy_file.assert_not_called()
 
     @pytest.mark.parametrize('copy', [True, False])
-    def test_duplicate_origins_fails(self, mock_shutil, copy, target):
+    def test_duplicate_origins_fails(self, mock_move_file, mock_copy_file, copy, target):
         outpath = Path('testpath')
         data = deepcopy(RECORD_LINKS)
         duplicate_data = deepcopy(RECORD_LINKS[0])
@@ -229,11 +379,11 @@ class TestMoveAudioFiles:
                 dry_run=False,
             )
 
-        mock_shutil.move.assert_not_called()
-        mock_shutil.copyfile.assert_not_called()
+        mock_move_file.assert_not_called()
+        mock_copy_file.assert_not_called()
 
     @pytest.mark.parametrize('copy', [True, False])
-    def test_duplicate_targets_fails(self, mock_shutil, copy, target):
+    def test_duplicate_targets_fails(self, mock_move_file, mock_copy_file, copy, target):
         outpath = Path('testpath')
         data = deepcopy(RECORD_LINKS)
         duplicate_data = RECORD_LINKS[0]
@@ -247,8 +397,8 @@ class TestMoveAudioFiles:
             )
 
         assert res is None
-        mock_shutil.move.assert_not_called()
-        mock_shutil.copyfile.assert_not_called()
+        mock_move_file.assert_not_called()
+        mock_copy_file.assert_not_called()
 
 
 class TestMainValid:
@@ -274,10 +424,20 @@ class TestMainValid:
         return mocker.patch('play_takeout_to_plex.takeout_converter.output_main_csv')
 
     @pytest.fixture
-    def all_mocks(self, mock_merge, mock_fuse, mock_move, mock_output):
+    def mock_record(self, mocker):
+        return mocker.patch('play_takeout_to_plex.takeout_converter.write_transfer_record')
+
+    @pytest.fixture
+    def all_mocks(self, mock_merge, mock_fuse, mock_move, mock_output, mock_record):
         '''Simple helper to mock away all utilities without repeating long args lists'''
         return
 
+    @pytest.fixture
+    def package_logger(self):
+        package_logger = logging.getLogger('play_takeout_to_plex')
+        yield package_logger
+        package_logger.setLevel(logging.NOTSET)
+
     @pytest.fixture
     def mock_args(self, mocker):
         from argparse import Namespace
@@ -356,6 +516,20 @@ class TestMainValid:
         mock_logger.error.assert_called_once_with(
             'Main CSV file must be a csv file. %s is not a csv file.', str(Path('maincsv.csv').absolute()))
 
+    def test_main_csv_with_watch(self, mocker, mock_args, target):
+        mock_parser = mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': 'maincsv.csv',
+            'output_directory': 'out',
+            'watch': True,
+        })
+        mock_parser.error.side_effect = SystemExit(2)
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        with pytest.raises(SystemExit):
+            target()
+        mock_parser.error.assert_called_once_with(
+            '--main-csv cannot be used with --watch, which builds the main csv as csvs arrive.')
+
     def test_csv_file_create_main_fusion_failure(self,
                                                  mocker,
                                                  mock_merge,
@@ -393,8 +567,247 @@ class TestMainValid:
         }
         mock_args(cmd_args)
         mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
-        mock_merge.return_value = (None, None, ['errors_list'])
+        mock_merge.return_value = ([], [Path('lost.mp3')], [])
+        mock_report = mocker.patch('play_takeout_to_plex.takeout_converter.write_match_report')
+        with pytest.raises(SystemExit):
+            target()
+
+        report_path, failures = mock_report.call_args[0]
+        assert report_path == Path('Songs/match_report.db')
+        assert [failure.file for failure in failures] == ['lost.mp3']
+        mock_logger.error.assert_called_once_with(
+            'Failed to match csv with actual files. %d failures written to %s', 1, str(report_path))
+
+    def test_verify_mismatch_fails(self,
+                                   mocker,
+                                   mock_merge,
+                                   mock_fuse,
+                                   mock_move,
+                                   mock_output,
+                                   mock_args,
+                                   all_mocks,
+                                   target):
+        mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'verify_transfers': True,
+        })
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mock_merge.return_value = RECORD_LINKS
+        mock_move.return_value = [(Path('a.mp3'), Path('out/a.mp3'))]
         with pytest.raises(SystemExit):
             target()
 
-        mock_logger.error.assert_called_once_with('Failed to match csv with actual files')
+    @pytest.mark.parametrize('index,expect_main_csv', [(0, True), (1, False)])
+    def test_shard_writes_report(self,
+                                 mocker,
+                                 mock_merge,
+                                 mock_fuse,
+                                 mock_move,
+                                 mock_output,
+                                 mock_args,
+                                 all_mocks,
+                                 index,
+                                 expect_main_csv,
+                                 target):
+        from play_takeout_to_plex.sharding import Shard
+        shard = Shard(index, 2)
+        cmd_args = {
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'shard': shard,
+        }
+        mock_args(cmd_args)
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mocker.patch('play_takeout_to_plex.takeout_converter.os.makedirs')
+        mock_report = mocker.patch('play_takeout_to_plex.takeout_converter.write_shard_report')
+        target()
+
+        assert mock_merge.call_args[0][4] == shard
+        assert mock_output.called is expect_main_csv
+        mock_report.assert_called_once_with(shard, mock_move.return_value, Path('out'), {})
+
+    def test_profile_stages(self,
+                            mocker,
+                            tmp_path,
+                            package_logger,
+                            mock_merge,
+                            mock_fuse,
+                            mock_move,
+                            mock_output,
+                            mock_args,
+                            all_mocks,
+                            target):
+        cmd_args = {
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'profile': 'sample',
+            'profile_directory': str(tmp_path),
+        }
+        mock_args(cmd_args)
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        target()
+
+        assert sorted(path.name for path in tmp_path.glob('*.txt')) == [
+            'fuse_main_csv.txt',
+            'merge_csv_with_filetags.txt',
+            'move_audio_files.txt',
+        ]
+        assert package_logger.level == logging.INFO
+
+    def test_default_log_level(self,
+                               mocker,
+                               mock_merge,
+                               mock_fuse,
+                               mock_move,
+                               mock_output,
+                               mock_args,
+                               all_mocks,
+                               package_logger,
+                               target):
+        mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+        })
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        target()
+
+        assert package_logger.level == logging.NOTSET
+
+    def test_throttle(self,
+                      package_logger,
+                      mocker,
+                      tmp_path,
+                      mock_merge,
+                      mock_fuse,
+                      mock_move,
+                      mock_output,
+                      mock_args,
+                      all_mocks,
+                      target):
+        control_file = tmp_path / 'throttle.conf'
+        control_file.write_text('ops_per_second = 50\n')
+        cmd_args = {
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'max_mb_per_second': 20.0,
+            'throttle_control': str(control_file),
+        }
+        mock_args(cmd_args)
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mock_signal = mocker.patch('play_takeout_to_plex.throttle.signal.signal')
+        target()
+
+        from play_takeout_to_plex.throttle import MEGABYTE
+        throttle = mock_merge.call_args[0][5]
+        assert mock_move.call_args[0][8] is throttle
+        assert throttle.bandwidth.rate == 20 * MEGABYTE
+        assert throttle.operations.rate == 50
+        assert mock_signal.called
+
+    def test_no_throttle(self,
+                         mocker,
+                         mock_merge,
+                         mock_fuse,
+                         mock_move,
+                         mock_output,
+                         mock_args,
+                         all_mocks,
+                         target):
+        mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+        })
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        target()
+
+        assert mock_merge.call_args[0][5] is None
+        assert mock_move.call_args[0][8] is None
+
+    @pytest.mark.parametrize('dry_run', [True, False])
+    def test_writes_transfer_record(self,
+                                    mocker,
+                                    mock_merge,
+                                    mock_fuse,
+                                    mock_move,
+                                    mock_output,
+                                    mock_args,
+                                    mock_record,
+                                    all_mocks,
+                                    dry_run,
+                                    target):
+        mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'dry_run': dry_run,
+        })
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mocker.patch('play_takeout_to_plex.takeout_converter.os.makedirs')
+        target()
+
+        if dry_run:
+            mock_record.assert_not_called()
+        else:
+            mock_record.assert_called_once_with(mock_move.return_value, Path('out'), {})
+
+    def test_watch(self,
+                   package_logger,
+                   mocker,
+                   mock_merge,
+                   mock_fuse,
+                   mock_move,
+                   mock_output,
+                   mock_args,
+                   all_mocks,
+                   target):
+        cmd_args = {
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'watch': True,
+            'watch_idle_timeout': 60.0,
+        }
+        mock_args(cmd_args)
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mock_watch = mocker.patch.object(watch, 'watch_takeout')
+        target()
+
+        full_path, converter, interval, idle_timeout = mock_watch.call_args[0]
+        assert (full_path, interval, idle_timeout) == (Path('Songs'), 2.0, 60.0)
+        assert converter.output_directory == Path('out')
+        assert converter.transfer_options['copy'] is True
+        mock_fuse.assert_not_called()
+        mock_merge.assert_not_called()
+
+    def test_watch_options(self,
+                           mocker,
+                           tmp_path,
+                           package_logger,
+                           mock_args,
+                           all_mocks,
+                           target):
+        mock_args({
+            'takeout_tracks_directory': 'Songs',
+            'main_csv': None,
+            'output_directory': 'out',
+            'watch': True,
+            'io_order': 'inode',
+            'csv_workers': 3,
+            'profile': 'sample',
+            'profile_directory': str(tmp_path),
+        })
+        mocker.patch('play_takeout_to_plex.takeout_converter.Path.is_dir', return_value=True)
+        mock_watch = mocker.patch.object(watch, 'watch_takeout')
+        target()
+
+        converter = mock_watch.call_args[0][1]
+        assert converter.csv_workers == 3
+        assert converter.transfer_options['io_order'] == 'inode'
+        assert [path.name for path in tmp_path.glob('*.txt')] == ['watch_takeout.txt']
@@ -0,0 +1,127 @@
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestTokenBucket:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.throttle import TokenBucket
+        return TokenBucket
+
+    def test_unlimited(self, clock, target):
+        bucket = target(None, clock=clock, sleep=clock.sleep)
+        assert bucket.acquire(10 ** 9) == 0.0
+        assert clock.slept == []
+
+    def test_burst_then_paced(self, clock, target):
+        bucket = target(10, clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            bucket.acquire(1)
+        assert clock.slept == []
+        bucket.acquire(5)
+        assert clock.slept == [pytest.approx(0.5)]
+
+    def test_refills_over_time(self, clock, target):
+        bucket = target(10, clock=clock, sleep=clock.sleep)
+        bucket.acquire(10)
+        clock.now += 1.0
+        bucket.acquire(10)
+        assert clock.slept == []
+
+    def test_large_request_is_paid_back(self, clock, target):
+        bucket = target(10, clock=clock, sleep=clock.sleep)
+        assert bucket.acquire(30) == pytest.approx(2.0)
+        assert bucket.acquire(10) == pytest.approx(1.0)
+
+    def test_set_rate(self, clock, target):
+        bucket = target(10, clock=clock, sleep=clock.sleep)
+        bucket.set_rate(2)
+        assert bucket.acquire(4) == pytest.approx(1.0)
+        bucket.set_rate(None)
+        assert bucket.acquire(1000) == 0.0
+
+
+class TestIOThrottle:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.throttle import IOThrottle
+        return IOThrottle
+
+    def test_disabled(self, target):
+        throttle = target()
+        assert not throttle.enabled
+        throttle.operation(1024)
+        assert throttle.stats.operations == 1
+
+    def test_stats_and_report(self, mocker, target):
+        from play_takeout_to_plex.throttle import MEGABYTE
+        mock_logger = mocker.patch('play_takeout_to_plex.throttle.logger')
+        throttle = target(mb_per_second=1000, ops_per_second=1000)
+        throttle.operation()
+        throttle.transfer(2 * MEGABYTE)
+        throttle.operation(MEGABYTE)
+        with throttle.stage('move_audio_files'):
+            pass
+
+        assert mock_logger.info.call_args[0][1:3] == ('move_audio_files', 2)
+        assert mock_logger.info.call_args[0][3] == pytest.approx(3.0)
+        assert throttle.stats.operations == 0
+
+    def test_control_file(self, tmp_path, target):
+        from play_takeout_to_plex.throttle import MEGABYTE
+        control_file = tmp_path / 'throttle.conf'
+        control_file.write_text('# limits\nmb_per_second = 5\nops_per_second = 20\n')
+        throttle = target(mb_per_second=100, control_file=control_file)
+        assert throttle.enabled
+        assert throttle.bandwidth.rate == 5 * MEGABYTE
+        assert throttle.operations.rate == 20
+
+        control_file.write_text('mb_per_second = 50\n')
+        throttle._request_reload(None, None)
+        throttle.operation()
+        assert throttle.bandwidth.rate == 50 * MEGABYTE
+        assert throttle.operations.rate == 20
+
+        control_file.write_text('ops_per_second = 0\n')
+        throttle._request_reload(None, None)
+        throttle.operation()
+        assert throttle.bandwidth.rate == 50 * MEGABYTE
+        assert throttle.operations.rate is None
+
+    def test_control_file_keeps_cli_limits(self, tmp_path, target):
+        from play_takeout_to_plex.throttle import MEGABYTE
+        control_file = tmp_path / 'throttle.conf'
+        control_file.write_text('mb_per_second = 5\n')
+        throttle = target(ops_per_second=2, control_file=control_file)
+        assert throttle.bandwidth.rate == 5 * MEGABYTE
+        assert throttle.operations.rate == 2
+
+    def test_control_file_invalid_keeps_limits(self, mocker, tmp_path, target):
+        from play_takeout_to_plex.throttle import MEGABYTE
+        mock_logger = mocker.patch('play_takeout_to_plex.throttle.logger')
+        control_file = tmp_path / 'throttle.conf'
+        control_file.write_text('mb_per_second = 5\n')
+        throttle = target(control_file=control_file)
+
+        control_file.write_text('mb_per_second = fast\n')
+        throttle._request_reload(None, None)
+        throttle.operation()
+        assert throttle.bandwidth.rate == 5 * MEGABYTE
+        assert mock_logger.error.called
@@ -0,0 +1,135 @@
+import hashlib
+
+import pytest
+
+
+@pytest.fixture
+def origin(tmp_path):
+    origin = tmp_path / 'origin.mp3'
+    origin.write_bytes(b'ID3' + bytes(range(256)) * 5000)
+    return origin
+
+
+@pytest.fixture
+def expect_digest(origin):
+    return hashlib.sha256(origin.read_bytes()).hexdigest()
+
+
+class TestCopyFile:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.transfer import copy_file
+        return copy_file
+
+    @pytest.mark.parametrize('kernel_copy', [True, False])
+    @pytest.mark.parametrize('drop_cache', [True, False])
+    def test_valid(self, tmp_path, origin, kernel_copy, drop_cache, target):
+        out = tmp_path / 'out.mp3'
+        target(origin, out, buffer_size=1000, drop_cache=drop_cache, kernel_copy=kernel_copy)
+        assert out.read_bytes() == origin.read_bytes()
+
+    def test_kernel_copy_unsupported_falls_back(self, mocker, tmp_path, origin, target):
+        import errno
+        unsupported = OSError(errno.EXDEV, 'cross-device')
+        mocker.patch('play_takeout_to_plex.transfer.os.copy_file_range', side_effect=unsupported, create=True)
+        mocker.patch('play_takeout_to_plex.transfer.os.sendfile', side_effect=unsupported, create=True)
+        out = tmp_path / 'out.mp3'
+        target(origin, out)
+        assert out.read_bytes() == origin.read_bytes()
+
+    def test_kernel_copy_error_raises(self, mocker, tmp_path, origin, target):
+        import errno
+        mocker.patch('play_takeout_to_plex.transfer.os.copy_file_range',
+                     side_effect=OSError(errno.ENOSPC, 'no space'), create=True)
+        with pytest.raises(OSError):
+            target(origin, tmp_path / 'out.mp3')
+
+    @pytest.mark.parametrize('kernel_copy', [True, False])
+    def test_throttle_counts_every_chunk(self, mocker, tmp_path, origin, kernel_copy, target):
+        throttle = mocker.Mock()
+        out = tmp_path / 'out.mp3'
+        target(origin, out, buffer_size=100000, kernel_copy=kernel_copy, throttle=throttle)
+        assert out.read_bytes() == origin.read_bytes()
+        chunks = [transfer.args[0] for transfer in throttle.transfer.mock_calls]
+        assert sum(chunks) == origin.stat().st_size
+        assert max(chunks) <= 100000
+
+
+class TestMoveFile:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.transfer import move_file
+        return move_file
+
+    def test_across_filesystems_uses_copy_file(self, mocker, tmp_path, origin, target):
+        data = origin.read_bytes()
+        mocker.patch('play_takeout_to_plex.transfer.os.rename', side_effect=OSError('cross-device'))
+        throttle = mocker.Mock()
+        out = tmp_path / 'out.mp3'
+        target(origin, out, throttle=throttle)
+        assert out.read_bytes() == data
+        assert not origin.exists()
+        assert sum(transfer.args[0] for transfer in throttle.transfer.mock_calls) == len(data)
+
+
+class TestCopyAndHash:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.transfer import copy_and_hash
+        return copy_and_hash
+
+    @pytest.mark.parametrize('buffer_size', [1, 1000, 1024 * 1024])
+    @pytest.mark.parametrize('drop_cache', [True, False])
+    def test_valid(self, tmp_path, origin, expect_digest, buffer_size, drop_cache, target):
+        out = tmp_path / 'out.mp3'
+        assert target(origin, out, buffer_size=buffer_size, drop_cache=drop_cache) == expect_digest
+        assert out.read_bytes() == origin.read_bytes()
+
+
+class TestVerifiedTransfer:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.transfer import verified_transfer
+        return verified_transfer
+
+    @pytest.mark.parametrize('move', [True, False])
+    def test_valid(self, tmp_path, origin, expect_digest, move, target):
+        out = tmp_path / 'out.mp3'
+        result = target(origin, out, move=move)
+
+        assert result.verified
+        assert result.moved is move
+        assert result.source_digest == result.target_digest == expect_digest
+        assert origin.exists() is not move
+
+    @pytest.mark.parametrize('move', [True, False])
+    def test_mismatch_keeps_origin(self, mocker, tmp_path, origin, move, target):
+        mocker.patch('play_takeout_to_plex.transfer.hash_file', return_value='corrupt')
+        out = tmp_path / 'out.mp3'
+        result = target(origin, out, move=move)
+
+        assert not result.verified
+        assert not result.moved
+        assert origin.exists()
+        assert not out.exists()
+        assert (tmp_path / 'out.mp3.mismatch').exists()
+
+
+class TestWriteManifest:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.transfer import write_manifest
+        return write_manifest
+
+    def test_valid(self, tmp_path, target):
+        from play_takeout_to_plex.transfer import TransferResult
+        results = [
+            TransferResult(tmp_path / 'a.mp3', tmp_path / 'out/a.mp3', 'abc', 'abc', moved=True),
+            TransferResult(tmp_path / 'b.mp3', tmp_path / 'out/b.mp3', 'abc', 'def'),
+        ]
+        target(results, tmp_path)
+
+        lines = (tmp_path / 'transfer_manifest.csv').read_text().splitlines()
+        assert lines[0] == 'Origin,Target,Source sha256,Target sha256,Operation,Status'
+        assert lines[1] == f'{tmp_path}/a.mp3,{tmp_path}/out/a.mp3,abc,abc,move,ok'
+        assert lines[2] == f'{tmp_path}/b.mp3,{tmp_path}/out/b.mp3,abc,def,copy,mismatch'
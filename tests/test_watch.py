@@ -0,0 +1,240 @@
+from pathlib import Path
+
+import pytest
+
+from .fixtures import HEADER_ROW, CSV_RECORDS, AUDIO_FILES
+
+
+def audiofile_name(audiofile):
+    return f'{audiofile.tag.artist} - {audiofile.tag.album} - {audiofile.tag.title}.mp3'
+
+
+@pytest.fixture
+def mock_eyed3(mocker):
+    by_name = {audiofile_name(audiofile): audiofile for audiofile in AUDIO_FILES}
+    eyed3 = mocker.patch('play_takeout_to_plex.songs.eyed3')
+    eyed3.load.side_effect = lambda path: by_name[Path(path).name]
+    return eyed3
+
+
+def write_track(directory, index, csv=True, audio=True):
+    paths = []
+    if csv:
+        paths.append(directory / f'{index}.csv')
+        paths[-1].write_text(f'{HEADER_ROW}{CSV_RECORDS[index]}')
+    if audio:
+        paths.append(directory / audiofile_name(AUDIO_FILES[index]))
+        paths[-1].write_bytes(b'ID3')
+    return paths
+
+
+class TestPollingWatcher:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.watch import PollingWatcher
+        return PollingWatcher
+
+    def test_reports_settled_files_once(self, tmp_path, target):
+        watcher = target(tmp_path, interval=0)
+        csv_file, mp3_file = write_track(tmp_path, 0)
+        (tmp_path / 'cover.jpg').write_bytes(b'')
+
+        assert watcher.poll() == []
+        assert watcher.poll() == [csv_file, mp3_file]
+        assert watcher.poll() == []
+
+    def test_waits_while_written(self, tmp_path, target):
+        watcher = target(tmp_path, interval=0)
+        mp3_file = tmp_path / 'partial.mp3'
+        mp3_file.write_bytes(b'ID3')
+        assert watcher.poll() == []
+        mp3_file.write_bytes(b'ID3 and more')
+        assert watcher.poll() == []
+        assert watcher.changes() == [mp3_file]
+
+
+class TestInotifyWatcher:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.watch import InotifyWatcher
+
+        def make(path, interval=0.2):
+            try:
+                return InotifyWatcher(path, interval)
+            except OSError:
+                pytest.skip('inotify is not available')
+        return make
+
+    def test_valid(self, tmp_path, target):
+        existing = write_track(tmp_path, 0)
+        watcher = target(tmp_path)
+        try:
+            # Unchanged for the whole first interval, so already settled.
+            assert watcher.changes() == sorted(existing)
+
+            (tmp_path / 'cover.jpg').write_bytes(b'')
+            landed = write_track(tmp_path, 1)
+            assert watcher.changes() == landed
+            assert watcher.changes() == []
+        finally:
+            watcher.close()
+
+    def test_existing_file_waits_until_written(self, tmp_path, target):
+        partial = tmp_path / 'partial.mp3'
+        with open(partial, 'wb') as outfile:
+            outfile.write(b'ID3')
+            outfile.flush()
+            watcher = target(tmp_path)
+            try:
+                for _ in range(3):
+                    outfile.write(b'more')
+                    outfile.flush()
+                    assert watcher.changes() == []
+            except BaseException:
+                watcher.close()
+                raise
+        try:
+            assert watcher.changes() == [partial]
+            assert watcher.changes() == []
+        finally:
+            watcher.close()
+
+    def test_queue_overflow_rescans(self, mocker, tmp_path, target):
+        from play_takeout_to_plex.watch import INOTIFY_EVENT, IN_Q_OVERFLOW
+        watcher = target(tmp_path)
+        try:
+            landed = write_track(tmp_path, 0)
+            assert watcher.changes() == landed
+
+            dropped = write_track(tmp_path, 1)
+            # Stand in for the kernel dropping the events of the second track.
+            os_read = mocker.patch('play_takeout_to_plex.watch.os.read',
+                                   return_value=INOTIFY_EVENT.pack(-1, IN_Q_OVERFLOW, 0, 0))
+            mock_logger = mocker.patch('play_takeout_to_plex.watch.logger')
+            assert watcher.changes() == []
+            assert mock_logger.warning.called
+            mocker.stop(os_read)
+
+            # Drain the real events, then the rescanned files settle.
+            watcher._read_events()
+            assert watcher.changes() == sorted(dropped)
+            assert watcher.changes() == []
+        finally:
+            watcher.close()
+
+
+class TestMakeWatcher:
+    def test_falls_back_to_polling(self, mocker, tmp_path):
+        from play_takeout_to_plex.watch import PollingWatcher, make_watcher
+        mocker.patch('play_takeout_to_plex.watch.InotifyWatcher', side_effect=OSError('unavailable'))
+        assert isinstance(make_watcher(tmp_path), PollingWatcher)
+
+
+class TestIncrementalConverter:
+    @pytest.fixture
+    def target(self, tmp_path):
+        from play_takeout_to_plex.watch import IncrementalConverter
+        return IncrementalConverter(tmp_path / 'out', dry_run=True)
+
+    def test_audio_waits_for_csv(self, mock_eyed3, tmp_path, target):
+        [mp3_file] = write_track(tmp_path, 0, csv=False)
+        target.add_files([mp3_file])
+        assert target.flush() == []
+        assert len(target.waiting_tags) == 1
+
+        target.add_files(write_track(tmp_path, 0, audio=False) + write_track(tmp_path, 1))
+        transfers = target.flush()
+        assert [target for _, target in transfers] == [
+            tmp_path / 'out/Bob Marley/Live From London/03 - I Shot The Sheriff.mp3',
+            tmp_path / "out/Bob Marley/Burnin'/05 - I Shot The Sheriff.mp3",
+        ]
+        assert target.waiting_tags == []
+        assert target.transferred == 2
+
+    def test_files_read_once(self, mock_eyed3, tmp_path, target):
+        paths = write_track(tmp_path, 0)
+        target.add_files(paths)
+        target.add_files(paths)
+        assert mock_eyed3.load.call_count == 1
+        assert len(target.records) == 1
+
+    def test_duplicate_target_skipped(self, mock_eyed3, tmp_path, target):
+        target.add_files(write_track(tmp_path, 0))
+        assert len(target.flush()) == 1
+
+        target.seen.clear()
+        target.add_files(write_track(tmp_path, 0, csv=False))
+        assert target.flush() == []
+        assert target.transferred == 1
+        assert target.duplicates == [tmp_path / audiofile_name(AUDIO_FILES[0])]
+
+    def test_duplicate_target_in_batch_keeps_rest(self, mock_eyed3, tmp_path, target):
+        paths = write_track(tmp_path, 0) + write_track(tmp_path, 1)
+        duplicate = tmp_path / 'copy of track 0.mp3'
+        duplicate.write_bytes(b'ID3')
+        mock_eyed3.load.side_effect = lambda path: AUDIO_FILES[0] if path == duplicate else {
+            audiofile_name(audiofile): audiofile for audiofile in AUDIO_FILES}[Path(path).name]
+        target.add_files(paths + [duplicate])
+
+        assert len(target.flush()) == 2
+        assert target.duplicates == [duplicate]
+        assert target.waiting_tags == []
+
+    def test_throttle_paces_tag_reads(self, mocker, mock_eyed3, tmp_path):
+        from play_takeout_to_plex.watch import IncrementalConverter
+        throttle = mocker.Mock()
+        move = mocker.patch('play_takeout_to_plex.watch.move_audio_files', return_value=[])
+        target = IncrementalConverter(tmp_path / 'out', dry_run=True, throttle=throttle)
+        target.add_files(write_track(tmp_path, 0) + write_track(tmp_path, 1))
+        target.flush()
+
+        assert throttle.operation.call_count == 2
+        assert move.call_args[1]['throttle'] is throttle
+
+
+class TestWatchTakeout:
+    @pytest.fixture
+    def target(self):
+        from play_takeout_to_plex.watch import watch_takeout
+        return watch_takeout
+
+    def test_idle_timeout(self, mock_eyed3, mocker, tmp_path, target):
+        from play_takeout_to_plex.watch import IncrementalConverter, PollingWatcher
+        mocker.patch('play_takeout_to_plex.watch.make_watcher',
+                     side_effect=lambda path, interval: PollingWatcher(path, interval))
+        for index in range(3):
+            write_track(tmp_path, index)
+        converter = IncrementalConverter(tmp_path / 'out', dry_run=True)
+
+        target(tmp_path, converter, interval=0.01, idle_timeout=0.1)
+
+        assert converter.transferred == 3
+        assert (tmp_path / 'main_csv.csv').read_text().splitlines()[1:] == [str(r) for r in CSV_RECORDS[:3]]
+
+    def test_writes_transfer_record(self, mock_eyed3, mocker, tmp_path, target):
+        from play_takeout_to_plex.watch import IncrementalConverter, PollingWatcher
+        mocker.patch('play_takeout_to_plex.watch.make_watcher',
+                     side_effect=lambda path, interval: PollingWatcher(path, interval))
+        mocker.patch('play_takeout_to_plex.songs.SongTags.save_tags')
+        write_track(tmp_path, 0)
+        converter = IncrementalConverter(tmp_path / 'out')
+
+        target(tmp_path, converter, interval=0.01, idle_timeout=0.1)
+
+        lines = (tmp_path / 'out/transfers.csv').read_text().splitlines()
+        assert lines[1:] == [f'{origin},{target},0.csv' for origin, target in converter.transfers]
+        assert len(lines) == 2
+
+    def test_throttle_reports_batches(self, mock_eyed3, mocker, tmp_path, target):
+        from play_takeout_to_plex.throttle import IOThrottle
+        from play_takeout_to_plex.watch import IncrementalConverter, PollingWatcher
+        mocker.patch('play_takeout_to_plex.watch.make_watcher',
+                     side_effect=lambda path, interval: PollingWatcher(path, interval))
+        report = mocker.patch.object(IOThrottle, 'report')
+        write_track(tmp_path, 0)
+        throttle = IOThrottle(ops_per_second=1000)
+        converter = IncrementalConverter(tmp_path / 'out', dry_run=True, throttle=throttle)
+
+        target(tmp_path, converter, interval=0.01, idle_timeout=0.1)
+
+        assert report.call_args[0][0] == 'watch_batch'